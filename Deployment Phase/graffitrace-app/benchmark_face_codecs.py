@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import cv2
+import cubemap_sampler
+import face_store
+import image_loader
+
+# Encodings compared by default: (format, level)
+DEFAULT_ENCODINGS = [
+    ("png", 6),
+    ("png", 1),
+    ("png", 0),
+    ("webp", 0),
+    ("webp", 4),
+    ("jpeg", 95),
+    ("jpeg", 90),
+    ("npy", None),
+]
+
+
+def synthetic_face(face_w, seed=0):
+    """
+    Creates a street-like test face: smooth gradients with some blocky detail and
+    sensor noise, which compresses much more like a real photo than pure noise does.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:face_w, 0:face_w].astype(np.float32) / face_w
+    base = np.stack([120 + 80 * x, 110 + 60 * y, 100 + 50 * (x * y)], axis=-1)
+    blocks = cv2.resize(rng.integers(0, 60, (32, 32, 3)).astype(np.float32), (face_w, face_w),
+                        interpolation=cv2.INTER_NEAREST)
+    noise = rng.normal(0, 4, (face_w, face_w, 3))
+    return np.clip(base + blocks + noise, 0, 255).astype(np.uint8)
+
+
+def benchmark_encoding(face, face_format, level, directory, repeats):
+    """
+    Measures the encode time, decode time and file size of one face encoding.
+
+    Returns:
+        dict: The median encode/decode times in milliseconds and the bytes per face.
+    """
+    path = os.path.join(directory, face_store.face_file_name("face", face_format))
+    encode_times = []
+    decode_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        face_store.save_face(face, path, face_format, level)
+        encode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decoded = face_store.load_face(path)
+        np.asarray(decoded).sum()  # Touch every pixel so memory-mapped faces are really read
+        decode_times.append(time.perf_counter() - start)
+
+    max_error = int(np.abs(decoded[:, :, ::-1].astype(np.int16) - face.astype(np.int16)).max())
+    return {
+        "format": face_format,
+        "level": level,
+        "encode_ms": round(1000 * float(np.median(encode_times)), 2),
+        "decode_ms": round(1000 * float(np.median(decode_times)), 2),
+        "bytes_per_face": os.path.getsize(path),
+        "max_abs_error": max_error,
+    }
+
+
+def run_benchmark(face, encodings=DEFAULT_ENCODINGS, repeats=3):
+    """
+    Benchmarks every encoding on the given RGB face.
+
+    Returns:
+        list: One result dict per encoding.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        return [benchmark_encoding(face, face_format, level, directory, repeats) for face_format, level in encodings]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the face formats available for the Preprocessed directory.")
+    parser.add_argument("--panorama", help="Equirectangular JPEG to take a real right face from (default: synthetic face)")
+    parser.add_argument("--face-w", type=int, default=2048, help="Face width in pixels")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per encoding (the median is reported)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.panorama:
+        panorama = image_loader.load_equirectangular(args.panorama, args.face_w)
+        face = cubemap_sampler.extract_faces(panorama, args.face_w, ("R",))["R"]
+    else:
+        face = synthetic_face(args.face_w)
+
+    results = run_benchmark(face, repeats=args.repeats)
+
+    print(f"{'format':<8}{'level':>6}{'encode ms':>12}{'decode ms':>12}{'KiB/face':>12}{'max err':>9}")
+    for result in results:
+        level = "-" if result["level"] is None else result["level"]
+        print(f"{result['format']:<8}{level:>6}{result['encode_ms']:>12}{result['decode_ms']:>12}"
+              f"{result['bytes_per_face'] / 1024:>12.0f}{result['max_abs_error']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"face_w": args.face_w, "results": results}, f, indent=2)
@@ -0,0 +1,186 @@
+import os
+import json
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+import cv2
+from PIL import Image
+import data_preprocessing
+import memory_stats
+
+# Panorama sizes generated by default (width x height, 2:1 equirectangular)
+DEFAULT_RESOLUTIONS = [(4096, 2048), (8192, 4096)]
+
+# Preprocessing configurations run on every resolution
+DEFAULT_CONFIGS = [
+    {"name": "png", "face_format": "png", "workers": None},
+    {"name": "png-1-worker", "face_format": "png", "workers": 1},
+    {"name": "png-rerun", "face_format": "png", "workers": None, "rerun": True},
+    {"name": "webp", "face_format": "webp", "workers": None},
+    {"name": "jpeg", "face_format": "jpeg", "workers": None},
+    {"name": "npy", "face_format": "npy", "workers": None},
+    {"name": "streaming", "face_format": "png", "workers": None, "streaming": True},
+]
+
+# Where the synthetic panoramas are "taken" (somewhere in Los Baños, Laguna)
+BASE_LATITUDE = 14.1670
+BASE_LONGITUDE = 121.2430
+
+
+def _dms(degrees):
+    """Splits decimal degrees into the (degrees, minutes, seconds) triple EXIF stores."""
+    # Round the total to 1/10000 s first, so rounding can never leave 60 seconds (or minutes) behind
+    total = round(abs(degrees) * 3600 * 10000)
+    whole_degrees, rest = divmod(total, 3600 * 10000)
+    minutes, seconds = divmod(rest, 60 * 10000)
+    return (float(whole_degrees), float(minutes), seconds / 10000)
+
+
+def synthetic_panorama(width, height, seed=0):
+    """
+    Creates a street-like equirectangular test image: a sky-to-ground gradient with
+    blocky "facades" around the horizon and sensor noise, so JPEG decoding and face
+    encoding cost about what they do on real panoramas.
+    """
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    sky = np.array([200, 170, 120], dtype=np.float32)
+    ground = np.array([90, 95, 100], dtype=np.float32)
+    image = np.repeat(sky + (ground - sky) * y, width, axis=1)
+    facades = cv2.resize(rng.integers(0, 90, (16, 64, 3)).astype(np.float32), (width, height // 2),
+                         interpolation=cv2.INTER_NEAREST)
+    image[height // 4:height // 4 + height // 2] += facades - 45
+    image += rng.normal(0, 4, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def write_geotagged_jpeg(image, path, latitude, longitude, quality=90):
+    """Saves an RGB array as a JPEG with GPS latitude and longitude EXIF tags."""
+    exif = Image.Exif()
+    gps = exif.get_ifd(0x8825)
+    gps[1] = "N" if latitude >= 0 else "S"
+    gps[2] = _dms(latitude)
+    gps[3] = "E" if longitude >= 0 else "W"
+    gps[4] = _dms(longitude)
+    Image.fromarray(image).save(path, quality=quality, exif=exif)
+
+
+def create_project(directory, width, height, num_images):
+    """
+    Creates a project directory with num_images geotagged synthetic panoramas in 'images'.
+
+    Returns:
+        str: The project directory.
+    """
+    images_directory = os.path.join(directory, "images")
+    os.makedirs(images_directory, exist_ok=True)
+    for i in range(num_images):
+        write_geotagged_jpeg(
+            synthetic_panorama(width, height, seed=i),
+            os.path.join(images_directory, f"pano_{i:03d}.jpg"),
+            BASE_LATITUDE + 0.0001 * i,
+            BASE_LONGITUDE + 0.0001 * i
+        )
+    return directory
+
+
+def run_config(project_directory, config):
+    """
+    Runs the preprocessing stage once with the given configuration.
+
+    Every configuration starts from an empty 'Preprocessed' directory, except "rerun"
+    ones, which convert once untimed and then measure the run that reuses those faces.
+    Streaming ones hand the faces to a queue that is drained as fast as possible.
+
+    Returns:
+        dict: The summary returned by data_preprocessing.process_images.
+    """
+    shutil.rmtree(os.path.join(project_directory, "Preprocessed"), ignore_errors=True)
+    data_preprocessing.prepare_directory(project_directory)
+    options = {"workers": config.get("workers"), "face_format": config["face_format"]}
+
+    if config.get("rerun"):
+        data_preprocessing.process_images(project_directory, **options)
+
+    if not config.get("streaming"):
+        return data_preprocessing.process_images(project_directory, **options)
+
+    face_queue = queue.Queue(8)
+
+    def drain():
+        while face_queue.get() is not None:
+            pass
+
+    consumer = threading.Thread(target=drain, daemon=True)
+    consumer.start()
+    try:
+        return data_preprocessing.process_images(project_directory, face_queue=face_queue, keep_faces=False, **options)
+    finally:
+        face_queue.put(None)
+        consumer.join()
+
+
+def run_benchmark(resolutions=DEFAULT_RESOLUTIONS, configs=DEFAULT_CONFIGS, num_images=4):
+    """
+    Benchmarks every configuration on a synthetic project for each resolution.
+
+    Returns:
+        list: One result dict per (resolution, configuration) pair.
+    """
+    results = []
+    for width, height in resolutions:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f"Generating {num_images} synthetic {width}x{height} panoramas...")
+            project_directory = create_project(directory, width, height, num_images)
+            for config in configs:
+                summary = run_config(project_directory, config)
+                worker_peaks = summary["worker_peak_rss"].values()
+                results.append({
+                    "resolution": f"{width}x{height}",
+                    "config": config["name"],
+                    "images": summary["images"],
+                    "converted_images": summary["converted_images"],
+                    "faces": summary["faces"],
+                    "seconds": round(summary["seconds"], 3),
+                    "images_per_sec": round(summary["images"] / summary["seconds"], 3),
+                    "stage_seconds": {stage: round(seconds, 4) for stage, seconds in summary["stage_seconds"].items()},
+                    "worker_peak_rss_mb": round(max(worker_peaks) / 2**20, 1) if worker_peaks else None,
+                })
+    return results
+
+
+def _parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing stage on synthetic geotagged panoramas.")
+    parser.add_argument("--resolutions", nargs="+", type=_parse_resolution,
+                        default=DEFAULT_RESOLUTIONS, help="Panorama sizes, e.g. 4096x2048 8192x4096")
+    parser.add_argument("--configs", nargs="+", choices=[config["name"] for config in DEFAULT_CONFIGS],
+                        help="Configurations to run (default: all)")
+    parser.add_argument("--images", type=int, default=4, help="Panoramas per resolution")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    configs = [config for config in DEFAULT_CONFIGS if not args.configs or config["name"] in args.configs]
+    results = run_benchmark(args.resolutions, configs, args.images)
+
+    print(f"\n{'resolution':<12}{'config':<15}{'img/s':>8}" + "".join(f"{stage:>12}" for stage in data_preprocessing.STAGES) + f"{'peak MB':>9}")
+    for result in results:
+        peak = "-" if result["worker_peak_rss_mb"] is None else f"{result['worker_peak_rss_mb']:.0f}"
+        print(f"{result['resolution']:<12}{result['config']:<15}{result['images_per_sec']:>8}"
+              + "".join(f"{result['stage_seconds'][stage]:>12}" for stage in data_preprocessing.STAGES) + f"{peak:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "face_w": data_preprocessing.FACE_W,
+                "cpu_count": os.cpu_count(),
+                "main_peak_rss_mb": round((memory_stats.peak_rss_bytes() or 0) / 2**20, 1),
+                "results": results,
+            }, f, indent=2)
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+# Box and label colours (BGR)
+BOX_COLOR = (0, 200, 0)
+TEXT_COLOR = (255, 255, 255)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def draw_boxes(image, boxes, scores, labels=None, scale=1.0):
+    """
+    Draws detection boxes and their scores straight onto a copy of the image with
+    OpenCV, instead of going through detectron2's matplotlib-based Visualizer.
+
+    Line width and text size follow the output size, so results look alike at any scale.
+
+    Args:
+        image (np.ndarray): The (H, W, 3) BGR image.
+        boxes (np.ndarray): (N, 4) boxes as x0, y0, x1, y1 in image pixels.
+        scores (np.ndarray): (N,) confidence scores between 0 and 1.
+        labels (list, optional): A class name to show before each score.
+        scale (float): Resize factor of the output image (1.0 keeps the native resolution).
+
+    Returns:
+        np.ndarray: The BGR image with the boxes drawn on it.
+    """
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    else:
+        image = np.ascontiguousarray(image).copy()
+
+    thickness = max(1, round(max(image.shape[:2]) / 600))
+    font_scale = 0.6 * thickness
+    for i, (box, score) in enumerate(zip(boxes, scores)):
+        x0, y0, x1, y1 = (np.asarray(box, dtype=np.float64) * scale).round().astype(int)
+        cv2.rectangle(image, (x0, y0), (x1, y1), BOX_COLOR, thickness, cv2.LINE_AA)
+
+        text = f"{score:.0%}" if labels is None else f"{labels[i]} {score:.0%}"
+        (text_w, text_h), baseline = cv2.getTextSize(text, FONT, font_scale, thickness)
+        text_y = max(y0, text_h + baseline)  # Keep the label inside the image at the top edge
+        cv2.rectangle(image, (x0, text_y - text_h - baseline), (x0 + text_w, text_y), BOX_COLOR, cv2.FILLED)
+        cv2.putText(image, text, (x0, text_y - baseline), FONT, font_scale, TEXT_COLOR, thickness, cv2.LINE_AA)
+    return image
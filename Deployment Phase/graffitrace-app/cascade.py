@@ -0,0 +1,222 @@
+import json
+import time
+import argparse
+import cv2
+import detect_images
+import resolution_policy
+from box_utils import box_iou
+
+# Size the faces are screened at, and the top score that sends a face on to full-resolution
+# inference. Tune both on the test split with this module's CLI.
+SCREEN_SIZE = 400
+SCREEN_THRESHOLD = 0.2
+
+# Screening thresholds compared by the CLI
+THRESHOLDS = (0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5)
+
+
+def top_score(instances):
+    """The highest detection score of a face, 0.0 if it has none."""
+    return float(instances.scores.max()) if len(instances) > 0 else 0.0
+
+
+def screening_predictor(full_predictor, screen_size):
+    """Returns a predictor that runs the model of a full-resolution predictor at the screening size."""
+    screen_cfg = resolution_policy.apply_to_cfg(full_predictor.cfg.clone(), screen_size)
+    screen_predictor = detect_images.BatchPredictor(screen_cfg, model=full_predictor.model)
+    screen_predictor.grad_mode = full_predictor.grad_mode
+    return screen_predictor
+
+
+class CascadePredictor:
+    """
+    Runs every face through the model at SCREEN_SIZE first and only sends faces whose top
+    score reaches the screening threshold on to full-resolution inference. Faces that are
+    screened out keep their (all low-scoring) screening detections.
+
+    Both passes share one model; the screening pass only changes the test-time resize.
+    Same preprocess/predict interface as detect_images.BatchPredictor, so detect_faces can
+    use it in place of one. The preprocessed inputs carry the original face along, and
+    escalated faces are resized for the full pass when they are escalated.
+    """
+
+    def __init__(self, cfg, backend="eager", num_threads=None, screen_size=SCREEN_SIZE,
+                 screen_threshold=SCREEN_THRESHOLD):
+        if backend == "onnx":
+            raise ValueError("The cascade needs one model at two input sizes; the ONNX graph has a fixed input size")
+        self.full = detect_images.build_predictor(cfg, backend, num_threads)
+        self.screen = screening_predictor(self.full, screen_size)
+        self.screen_threshold = screen_threshold
+        self.screened = 0
+        self.escalated = 0
+
+    def preprocess(self, original_image):
+        """Resizes one BGR face for the screening pass, keeping the face for the full pass."""
+        return self.screen.preprocess(original_image), original_image
+
+    def predict(self, inputs):
+        """Screens a batch of preprocessed faces and runs the promising ones again at full resolution."""
+        outputs = self.screen.predict([screen_inputs for screen_inputs, _ in inputs])
+        escalate = [i for i, output in enumerate(outputs) if top_score(output["instances"]) >= self.screen_threshold]
+        self.screened += len(inputs)
+        self.escalated += len(escalate)
+        if escalate:
+            for i, output in zip(escalate, self.full([inputs[i][1] for i in escalate])):
+                outputs[i] = output
+        return outputs
+
+    def __call__(self, original_images):
+        return self.predict([self.preprocess(image) for image in original_images])
+
+
+def box_recall(split, detections, threshold):
+    """
+    The fraction of ground-truth boxes matched (IoU >= 0.5) by a detection scoring at
+    least threshold, each detection matching at most one box.
+
+    Args:
+        split (list): (image_id, path, [[x, y, w, h], ...]) from load_test_split, with the
+                      boxes in the coordinates of the detections.
+        detections (dict): image_id -> (boxes, scores) as x0, y0, x1, y1 arrays.
+    """
+    matched = 0
+    total = 0
+    for image_id, _, gt_boxes in split:
+        boxes, scores = detections[image_id]
+        unmatched = [box for box, score in zip(boxes, scores) if score >= threshold]
+        for x, y, w, h in gt_boxes:
+            total += 1
+            gt = (x, y, x + w, y + h)
+            best = max(unmatched, key=lambda box: box_iou(gt, box), default=None)
+            if best is not None and box_iou(gt, best) >= 0.5:
+                matched += 1
+                unmatched = [box for box in unmatched if box is not best]
+    return matched / total if total else 1.0
+
+
+def run_faces(predictor, faces):
+    """Runs every face through the predictor alone; returns the boxes, scores and seconds of each."""
+    results = []
+    for face in faces:
+        start = time.perf_counter()
+        instances = predictor([face])[0]["instances"].to("cpu")
+        seconds = time.perf_counter() - start
+        results.append((instances.pred_boxes.tensor.numpy(), instances.scores.numpy(), seconds))
+    return results
+
+
+def evaluate_cascade(model_path, split, resolution=None, backend="eager", screen_sizes=(SCREEN_SIZE,),
+                     thresholds=THRESHOLDS):
+    """
+    Measures what screening costs in recall and gains in speed on an annotated split.
+
+    Every face is run once at full resolution and once per screening size, one face at a
+    time. As the cascade's output for a face is exactly the full-resolution output if it
+    is escalated and the screening output otherwise, every screening threshold is then
+    scored from these runs without running the model again.
+
+    Returns:
+        dict: The full-resolution box recall and faces/sec, and one result per screening
+              size and threshold with the box recall, the recall lost, the share of faces
+              escalated, the graffiti faces screened out and the speedup.
+    """
+    face_w = resolution_policy.face_width(resolution)
+    faces = []
+    scaled_split = []
+    for image_id, path, boxes in split:
+        image = cv2.imread(path)
+        scale = face_w / image.shape[1]
+        if image.shape[:2] != (face_w, face_w):
+            image = cv2.resize(image, (face_w, face_w), interpolation=cv2.INTER_AREA)
+        faces.append(image)
+        scaled_split.append((image_id, path, [[v * scale for v in box] for box in boxes]))
+
+    cfg = detect_images.setup_cfg(model_path, resolution)
+    threshold = detect_images.DETECTION_THRESHOLD
+    full_predictor = detect_images.build_predictor(cfg, backend)
+    run_faces(full_predictor, faces[:1])  # Warm up (and trace) outside the timed runs
+    full = run_faces(full_predictor, faces)
+    full_detections = {image_id: (boxes, scores) for (image_id, _, _), (boxes, scores, _) in zip(scaled_split, full)}
+    full_seconds = sum(seconds for *_, seconds in full)
+    full_recall = box_recall(scaled_split, full_detections, threshold)
+    graffiti_faces = [float(scores.max(initial=0.0)) >= threshold for _, scores, _ in full]
+
+    report = {
+        "faces": len(faces),
+        "full_recall": full_recall,
+        "full_faces_per_sec": len(faces) / full_seconds,
+        "results": [],
+    }
+    for screen_size in screen_sizes:
+        screen_predictor = screening_predictor(full_predictor, screen_size)
+        run_faces(screen_predictor, faces[:1])
+        screen = run_faces(screen_predictor, faces)
+        for screen_threshold in thresholds:
+            escalated = [float(scores.max(initial=0.0)) >= screen_threshold for _, scores, _ in screen]
+            detections = {
+                image_id: (full[i][:2] if escalated[i] else screen[i][:2])
+                for i, (image_id, _, _) in enumerate(scaled_split)
+            }
+            cascade_seconds = sum(
+                screen[i][2] + (full[i][2] if escalated[i] else 0.0) for i in range(len(faces))
+            )
+            recall = box_recall(scaled_split, detections, threshold)
+            report["results"].append({
+                "screen_size": screen_size,
+                "screen_threshold": screen_threshold,
+                "recall": recall,
+                "recall_lost": full_recall - recall,
+                "escalated": sum(escalated) / len(faces),
+                "graffiti_faces_missed": sum(g and not e for g, e in zip(graffiti_faces, escalated)),
+                "speedup": full_seconds / cascade_seconds,
+            })
+    return report
+
+
+def recommend(report, max_recall_lost):
+    """The fastest screening setting that loses at most max_recall_lost recall, or None."""
+    candidates = [result for result in report["results"] if result["recall_lost"] <= max_recall_lost]
+    return max(candidates, key=lambda result: result["speedup"], default=None)
+
+
+if __name__ == "__main__":
+    # Evaluation-only helpers, kept off the detection path that imports this module
+    from check_cpu_parity import DEFAULT_DATASET
+    from resolution_report import load_test_split
+
+    parser = argparse.ArgumentParser(description="Tune the screening pass of the cascade on the test split.")
+    parser.add_argument("--model", required=True, help="Path to the model weights")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="Split directory with annotations/test.json and images/")
+    parser.add_argument("--resolution", type=int, help="Resolution setting of the full pass")
+    parser.add_argument("--backend", default="eager", choices=["eager", "cpu-optimized"], help="Inference backend")
+    parser.add_argument("--screen-sizes", nargs="+", type=int, default=[320, SCREEN_SIZE, 480],
+                        help="Screening sizes to compare")
+    parser.add_argument("--max-recall-lost", type=float, default=0.01,
+                        help="Largest acceptable loss of box recall (0.01 = one point)")
+    parser.add_argument("--limit", type=int, help="Only use the first N test images")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    split = load_test_split(args.dataset, args.limit)
+    if not split:
+        raise SystemExit(f"No test images found in {args.dataset}")
+
+    report = evaluate_cascade(args.model, split, args.resolution, args.backend, args.screen_sizes)
+    print(f"\nFull resolution: box recall {report['full_recall']:.3f}, {report['full_faces_per_sec']:.2f} faces/s")
+    print(f"{'size':>6}{'thresh':>8}{'recall':>8}{'lost':>8}{'escalated':>11}{'missed':>8}{'speedup':>9}")
+    for result in report["results"]:
+        print(f"{result['screen_size']:>6}{result['screen_threshold']:>8.2f}{result['recall']:>8.3f}"
+              f"{result['recall_lost']:>8.3f}{result['escalated']:>11.0%}{result['graffiti_faces_missed']:>8}"
+              f"{result['speedup']:>8.2f}x")
+
+    best = recommend(report, args.max_recall_lost)
+    if best is None:
+        print(f"\nNo screening setting loses at most {args.max_recall_lost} recall; keep the cascade off.")
+    else:
+        print(f"\nRecommended: screen_size={best['screen_size']}, screen_threshold={best['screen_threshold']} "
+              f"({best['speedup']:.2f}x, recall lost {best['recall_lost']:.3f})")
+    report["recommended"] = best
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
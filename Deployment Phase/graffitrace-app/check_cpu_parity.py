@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+import detect_images
+from box_utils import box_iou
+
+# The held-out test split the models were evaluated on
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "datasets", "Test")
+
+
+def load_test_images(dataset_directory, limit=None):
+    """
+    Lists the images of a COCO-annotated split (annotations/test.json, images/).
+
+    Returns:
+        list: The paths of the images that exist on disk.
+    """
+    with open(os.path.join(dataset_directory, "annotations", "test.json")) as f:
+        coco_data = json.load(f)
+    paths = []
+    for image_info in coco_data.get("images", []):
+        path = os.path.join(dataset_directory, "images", image_info["file_name"])
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            print(f"Warning: Image file not found: {path}")
+    return paths[:limit] if limit else paths
+
+
+def compare_detections(reference, candidate, threshold, score_tolerance):
+    """
+    Matches the candidate boxes to the reference boxes (highest score first, best IoU).
+
+    Boxes without a partner only count as mismatches if their score is clearly above the
+    threshold; a detection hovering at the threshold may fall on either side of it.
+
+    Returns:
+        dict: The largest box coordinate and score differences of the matched pairs and
+              the number of unmatched boxes.
+    """
+    ref_boxes, ref_scores = reference
+    cand_boxes, cand_scores = candidate
+    unmatched = set(range(len(cand_boxes)))
+    max_box_diff = 0.0
+    max_score_diff = 0.0
+    missing = 0
+    for i in np.argsort(-ref_scores):
+        best = max(unmatched, key=lambda j: box_iou(ref_boxes[i], cand_boxes[j]), default=None)
+        if best is None or box_iou(ref_boxes[i], cand_boxes[best]) < 0.5:
+            missing += ref_scores[i] > threshold + score_tolerance
+            continue
+        unmatched.discard(best)
+        max_box_diff = max(max_box_diff, float(np.abs(ref_boxes[i] - cand_boxes[best]).max()))
+        max_score_diff = max(max_score_diff, float(abs(ref_scores[i] - cand_scores[best])))
+    extra = sum(cand_scores[j] > threshold + score_tolerance for j in unmatched)
+    return {"max_box_diff": max_box_diff, "max_score_diff": max_score_diff, "unmatched": int(missing + extra)}
+
+
+def run_predictions(predictor, paths):
+    """Runs every image through the predictor alone and returns the boxes, scores and total seconds."""
+    detections = []
+    seconds = 0.0
+    for path in paths:
+        image = cv2.imread(path)
+        start = time.perf_counter()
+        instances = predictor([image])[0]["instances"].to("cpu")
+        seconds += time.perf_counter() - start
+        detections.append((instances.pred_boxes.tensor.numpy(), instances.scores.numpy()))
+    return detections, seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that a CPU backend finds the same boxes as the eager model.")
+    parser.add_argument("--model", required=True, help="Path to the model weights (.pth)")
+    parser.add_argument("--backend", default="cpu-optimized", choices=["cpu-optimized", "onnx"], help="Backend to check")
+    parser.add_argument("--onnx-model", help="The model exported by onnx_backend.py (for --backend onnx)")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="Split directory with annotations/test.json and images/")
+    parser.add_argument("--limit", type=int, help="Only check the first N images")
+    parser.add_argument("--threads", type=int, help="Intra-op threads for the checked backend")
+    parser.add_argument("--box-tolerance", type=float, default=1.0, help="Largest allowed box coordinate difference in pixels")
+    parser.add_argument("--score-tolerance", type=float, default=0.01, help="Largest allowed score difference")
+    args = parser.parse_args()
+
+    if args.backend == "onnx" and not args.onnx_model:
+        parser.error("--backend onnx needs --onnx-model")
+    paths = load_test_images(args.dataset, args.limit)
+    if not paths:
+        sys.exit(f"No test images found in {args.dataset}")
+
+    cfg = detect_images.setup_cfg(args.model)
+    cfg.MODEL.DEVICE = "cpu"  # Compare like with like
+    threshold = cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = detect_images.DETECTION_THRESHOLD
+    eager, eager_seconds = run_predictions(detect_images.build_predictor(cfg, "eager"), paths)
+    if args.backend == "onnx":
+        cfg.MODEL.WEIGHTS = args.onnx_model
+    optimized_predictor = detect_images.build_predictor(cfg, args.backend, args.threads)
+    run_predictions(optimized_predictor, paths[:1])  # Trace / warm up outside the timed run
+    optimized, optimized_seconds = run_predictions(optimized_predictor, paths)
+
+    failures = 0
+    worst = {"max_box_diff": 0.0, "max_score_diff": 0.0, "unmatched": 0}
+    for path, reference, candidate in zip(paths, eager, optimized):
+        result = compare_detections(reference, candidate, threshold, args.score_tolerance)
+        failed = (result["max_box_diff"] > args.box_tolerance or result["max_score_diff"] > args.score_tolerance
+                  or result["unmatched"] > 0)
+        if failed:
+            failures += 1
+            print(f"MISMATCH {os.path.basename(path)}: {result}")
+        worst = {key: max(worst[key], value) for key, value in result.items()}
+
+    print(f"Images: {len(paths)}, mismatching: {failures}")
+    print(f"Largest box difference: {worst['max_box_diff']:.3f} px, largest score difference: {worst['max_score_diff']:.4f}")
+    print(f"Eager: {len(paths) / eager_seconds:.2f} img/s, {args.backend}: {len(paths) / optimized_seconds:.2f} img/s")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,108 @@
+import os
+import warnings
+import torch
+from detectron2.layers import FrozenBatchNorm2d
+
+
+def fold_frozen_batchnorm(model):
+    """
+    Folds every FrozenBatchNorm2d that follows a convolution into that convolution's
+    weights and bias, so inference runs one op per layer instead of two.
+
+    detectron2's Conv2d applies its `norm` right after the convolution, and a frozen
+    batch norm is just a per-channel scale and shift, so the result is unchanged.
+
+    Args:
+        model (torch.nn.Module): The model, modified in place.
+
+    Returns:
+        int: The number of folded layers.
+    """
+    folded = 0
+    for module in model.modules():
+        norm = getattr(module, "norm", None)
+        if not isinstance(module, torch.nn.Conv2d) or not isinstance(norm, FrozenBatchNorm2d):
+            continue
+        with torch.no_grad():
+            scale = norm.weight * (norm.running_var + norm.eps).rsqrt()
+            shift = norm.bias - norm.running_mean * scale
+            module.weight.mul_(scale.reshape(-1, 1, 1, 1))
+            if module.bias is None:
+                module.bias = torch.nn.Parameter(shift.clone())
+            else:
+                module.bias.mul_(scale).add_(shift)
+        module.norm = None
+        folded += 1
+    return folded
+
+
+class TracedBackbone(torch.nn.Module):
+    """
+    Stands in for a detectron2 backbone and runs a TorchScript trace of it, in
+    channels_last layout. A trace only holds for the input shape it was made with, so
+    one is made (and kept) for every padded batch shape that comes along; with
+    same-sized faces that is just one per batch size.
+    """
+
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+        self.traced = {}
+
+    # GeneralizedRCNN reads these from its backbone when padding the input batch
+    @property
+    def size_divisibility(self):
+        return self.backbone.size_divisibility
+
+    @property
+    def padding_constraints(self):
+        return getattr(self.backbone, "padding_constraints", {})
+
+    def output_shape(self):
+        return self.backbone.output_shape()
+
+    def forward(self, x):
+        x = x.contiguous(memory_format=torch.channels_last)
+        key = tuple(x.shape)
+        if key not in self.traced:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=torch.jit.TracerWarning)
+                traced = torch.jit.trace(self.backbone, x, strict=False, check_trace=False)
+            self.traced[key] = torch.jit.freeze(traced.eval())
+        return self.traced[key](x)
+
+
+def set_cpu_threads(num_threads=None):
+    """
+    Sets the intra-op thread count explicitly (default: one per logical CPU) instead of
+    leaving it to whichever library initialises the thread pool first.
+
+    Returns:
+        int: The thread count in use.
+    """
+    torch.set_num_threads(num_threads or os.cpu_count() or 1)
+    return torch.get_num_threads()
+
+
+def optimize_for_cpu(model, num_threads=None):
+    """
+    Prepares an eval-mode detectron2 GeneralizedRCNN for CPU inference: folds the frozen
+    batch norms into the convolutions, switches the weights to channels_last, replaces
+    the backbone with a traced one and sets the thread count.
+
+    Run the optimized model under torch.inference_mode().
+
+    Args:
+        model (torch.nn.Module): The model with its weights loaded, modified in place.
+        num_threads (int, optional): The intra-op thread count.
+
+    Returns:
+        torch.nn.Module: The model.
+    """
+    model.eval()
+    folded = fold_frozen_batchnorm(model)
+    model.to(memory_format=torch.channels_last)
+    model.backbone = TracedBackbone(model.backbone)
+    threads = set_cpu_threads(num_threads)
+    print(f"CPU-optimized model: folded {folded} batch norms, {threads} threads")
+    return model
@@ -0,0 +1,155 @@
+import numpy as np
+import cv2
+from functools import lru_cache
+
+# Cube faces in the same order and orientation as py360convert.e2c(..., cube_format='dict')
+FACE_NAMES = ("F", "R", "B", "L", "U", "D")
+
+# The only faces the app keeps (right first, then left, like the old e2c dict order)
+SIDE_FACES = ("R", "L")
+
+# cv2.remap stores source coordinates as 16-bit integers
+MAX_REMAP_SIZE = 32767
+
+
+def _face_xyz(face_name, face_w):
+    """
+    Returns the (x, y, z) cube coordinates of every pixel of a single face.
+
+    Args:
+        face_name (str): One of "F", "R", "B", "L", "U", "D".
+        face_w (int): The width (and height) of the face in pixels.
+
+    Returns:
+        tuple: Three (face_w, face_w) float64 arrays.
+    """
+    rng = np.linspace(-0.5, 0.5, num=face_w, dtype=np.float64)
+    x, y = np.meshgrid(rng, -rng)
+    x_flip = np.flip(x, 1)
+    y_flip = np.flip(y, 0)
+    half = np.full_like(x, 0.5)
+
+    if face_name == "F":
+        return x, y, half
+    if face_name == "R":
+        return half, y, x_flip
+    if face_name == "B":
+        return x_flip, y, -half
+    if face_name == "L":
+        return -half, y, x
+    if face_name == "U":
+        return x, half, y_flip
+    if face_name == "D":
+        return x, -half, y
+    raise ValueError(f"Unknown cube face: {face_name}")
+
+
+def _face_coordinates(face_name, face_w, height, width):
+    """
+    Computes where each pixel of a face samples the equirectangular image.
+
+    Returns:
+        tuple: (coor_x, coor_y) float32 arrays in source pixel coordinates.
+    """
+    x, y, z = _face_xyz(face_name, face_w)
+    u = np.arctan2(x, z)
+    v = np.arctan2(y, np.hypot(x, z))
+    coor_x = (u / (2 * np.pi) + 0.5) * width - 0.5
+    coor_y = (-v / np.pi + 0.5) * height - 0.5
+    # Columns wrap around (BORDER_WRAP), rows are clamped at the poles
+    coor_y = np.clip(coor_y, 0, height - 1)
+    return coor_x.astype(np.float32), coor_y.astype(np.float32)
+
+
+@lru_cache(maxsize=8)
+def source_rows(height, width, face_w, faces):
+    """
+    Works out which rows of the equirectangular image the requested faces sample from.
+
+    The side faces only reach 45 degrees above and below the horizon, so for ("R", "L")
+    this is the middle half of the panorama; the rows near the poles are never read.
+
+    Args:
+        height (int): Height of the equirectangular image.
+        width (int): Width of the equirectangular image.
+        face_w (int): The width (and height) of each output face.
+        faces (tuple): Names of the faces to project.
+
+    Returns:
+        tuple: (top, bottom), so that rows top to bottom - 1 hold every sample, including
+               the extra row read by bilinear interpolation.
+    """
+    top, bottom = height, 0
+    for face_name in faces:
+        _, coor_y = _face_coordinates(face_name, face_w, height, width)
+        top = min(top, int(np.floor(coor_y.min())))
+        bottom = max(bottom, int(np.floor(coor_y.max())) + 2)
+    return max(top, 0), min(bottom, height)
+
+
+@lru_cache(maxsize=8)
+def get_remap_tables(height, width, face_w, faces, top=0, bottom=None):
+    """
+    Precomputes the fixed-point remap tables for the requested faces.
+
+    The tables only depend on the input resolution, the face width, the face set and the
+    band of rows kept, so they are built once per process and reused for every panorama
+    of the same size.
+
+    Args:
+        height (int): Height of the full equirectangular image.
+        width (int): Width of the equirectangular image.
+        face_w (int): The width (and height) of each output face.
+        faces (tuple): Names of the faces to project, e.g. ("R", "L").
+        top (int): The first row of the band the tables will be applied to.
+        bottom (int, optional): The row after the last row of that band. Defaults to height.
+
+    Returns:
+        dict: Maps each face name to a (map1, map2) pair for cv2.remap.
+    """
+    if bottom is None:
+        bottom = height
+    if bottom - top >= MAX_REMAP_SIZE or width >= MAX_REMAP_SIZE:
+        raise ValueError(f"Image of {width}x{bottom - top} is too large to remap (limit {MAX_REMAP_SIZE - 1} px per side)")
+
+    tables = {}
+    for face_name in faces:
+        coor_x, coor_y = _face_coordinates(face_name, face_w, height, width)
+        coor_y = np.clip(coor_y - top, 0, bottom - top - 1)
+        map1, map2 = cv2.convertMaps(coor_x, coor_y, cv2.CV_16SC2)
+        map1.setflags(write=False)
+        map2.setflags(write=False)
+        tables[face_name] = (map1, map2)
+    return tables
+
+
+def extract_faces(equirectangular_image, face_w=2048, faces=SIDE_FACES, full_height=None, top=0):
+    """
+    Projects only the requested cube faces out of an equirectangular image.
+
+    Works directly on the uint8 pixels with a bilinear cv2.remap, so no float copy of
+    the panorama or of the unused faces is ever made. The image may also be just the
+    band of rows given by source_rows, cut out of a panorama full_height rows tall.
+
+    Args:
+        equirectangular_image (np.ndarray): The (H, W) or (H, W, C) uint8 panorama or band.
+        face_w (int): The width (and height) of each output face.
+        faces (tuple): Names of the faces to project.
+        full_height (int, optional): Height of the full panorama, when given a band.
+        top (int): The panorama row the band starts at.
+
+    Returns:
+        dict: Maps each face name to its (face_w, face_w[, C]) uint8 array.
+    """
+    band_height, width = equirectangular_image.shape[:2]
+    if full_height is None:
+        full_height = band_height
+    tables = get_remap_tables(full_height, width, face_w, tuple(faces), top, top + band_height)
+    return {
+        face_name: cv2.remap(
+            equirectangular_image, map1, map2,
+            interpolation=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_WRAP
+        )
+        for face_name, (map1, map2) in tables.items()
+    }
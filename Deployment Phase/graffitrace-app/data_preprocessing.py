@@ -1,12 +1,25 @@
 import os
 import csv
-import numpy as np
-from PIL import Image, ImageFile, ExifTags
-import py360convert
-from multiprocessing import Pool, get_context
-from PIL import Image  # Import  Image
+import contextlib
+import json
+import time
+import queue
+import hashlib
+from PIL import Image, ImageFile
+import cubemap_sampler
+import image_loader
+import face_store
+import memory_stats
+import resolution_policy
+from multiprocessing import get_context
 import warnings  # Import warnings
 
+# Default width (and height) of the saved cube faces, see resolution_policy.py
+FACE_W = resolution_policy.DEFAULT_RESOLUTION
+
+# Records which source images the faces in 'Preprocessed' came from
+INDEX_FILE_NAME = "preprocess_index.json"
+
 # Suppress Warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=Image.DecompressionBombWarning)
@@ -14,7 +27,8 @@ warnings.filterwarnings("ignore", category=Image.DecompressionBombWarning)
 
 def prepare_directory(base_directory):
     """
-    Creates the 'Preprocessed' directory and the 'preprocessed.csv' file.
+    Creates the 'Preprocessed' directory and, if it does not exist yet, the
+    'preprocessed.csv' file. Existing faces are kept so re-runs can reuse them.
 
     Args:
         base_directory (str): The base directory where 'Preprocessed' should be created.
@@ -23,135 +37,120 @@ def prepare_directory(base_directory):
     os.makedirs(preprocessed_dir, exist_ok=True)  # Create the directory, no error if it exists
 
     csv_path = os.path.join(preprocessed_dir, "preprocessed.csv")
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["image_name", "latitude", "longitude"])  # Write the header row
+    if not os.path.exists(csv_path):
+        with open(csv_path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["image_name", "latitude", "longitude"])  # Write the header row
+        print(f"Created CSV file: {csv_path}")
 
-    print(f"Created directory: {preprocessed_dir}")
-    print(f"Created CSV file: {csv_path}")
+    print(f"Using directory: {preprocessed_dir}")
     return preprocessed_dir  # Return the path to the preprocessed directory
 
-def _convert_to_degrees(value):
-    """
-    Helper function to convert GPS coordinates from degree/minute/second
-    to decimal degrees.
-    """
-    #print(f"Value in _convert_to_degrees: {value}, type: {type(value)}") #commented out
-    if isinstance(value, tuple):
-        d = float(value[0])
-        m = float(value[1]) / 60.0
-        s = float(value[2]) / 3600.0
-        return d + m + s
-    elif hasattr(value, '__float__'):
-        return float(value)
-    else:
-        return value
+# Stages process_image and process_images time (see process_images' summary)
+STAGES = ("exif", "decode", "projection", "encode", "manifest")
 
 
-def get_coordinates(gps_info):
-    """
-    Helper function to extract latitude and longitude from GPSInfo.
-    """
-    latitude = None
-    longitude = None
-    #print(f"GPS Info in get_coordinates: {gps_info}, type: {type(gps_info)}") #commented out
-    if 1 in gps_info and 2 in gps_info and 3 in gps_info and 4 in gps_info:
-        latitude = _convert_to_degrees(gps_info[2])
-        longitude = _convert_to_degrees(gps_info[4])
-        if gps_info[1] == 'S':
-            latitude = -latitude
-        if gps_info[3] == 'W':
-            longitude = -longitude
-    return latitude, longitude
-
-def get_exif_data(img):
-    """Extract EXIF data from an image."""
-    exif_data = {}
+@contextlib.contextmanager
+def timed(timings, stage):
+    """Adds the time spent in the with-block to timings[stage], if timings is given."""
+    start = time.perf_counter()
     try:
-        info = img._getexif()
-        if info:
-            for tag, value in info.items():
-                decoded_tag = ExifTags.TAGS.get(tag, tag)
-                exif_data[decoded_tag] = value
-    except AttributeError:
-        # If the image doesn't have _getexif() method
-        pass
-    return exif_data
-
-def process_image(args):
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def process_image(args, timings=None):
     """
-    Processes a single image: converts it to cubemap, saves left and right faces,
-    and saves the coordinates in a csv file.
+    Processes a single image: projects its left and right cube faces, saves them
+    under their preassigned names, and returns the manifest rows for them.
+    When streaming, the faces themselves are returned too and saving them is optional.
 
     Args:
         args (tuple): A tuple containing:
             - file (str): The filename of the image.
             - images_directory (str): The directory containing the input images.
             - output_directory (str): The directory to save the output images.
-            - image_counter (int): A counter for naming the output files.
+            - face_image_names (dict): Maps each face name to its output file name.
+            - face_format (str): The format to save the faces in (see face_store.FACE_FORMATS).
+            - encode_level (int): The encoder setting for that format, or None for its default.
+            - save_faces (bool): Whether to write the faces to the output directory.
+            - return_faces (bool): Whether to return the faces (as BGR arrays) with the rows.
+            - face_w (int): The width (and height) of the faces.
+        timings (dict, optional): Receives the seconds spent in the "exif", "decode",
+                                  "projection" and "encode" stages.
+
+    Returns:
+        tuple: (rows, error_message, face_arrays), where rows holds an [image_name, latitude,
+               longitude] entry for every face and face_arrays the matching faces (empty
+               unless return_faces is set).
     """
-    file, images_directory, output_directory, image_counter = args
-    if file.lower().endswith(".jpg") or file.lower().endswith(".jpeg"):
-        input_image_path = os.path.join(images_directory, file)
-        filename = os.path.splitext(file)[0]
+    (file, images_directory, output_directory, face_image_names, face_format, encode_level,
+     save_faces, return_faces, face_w) = args
+    input_image_path = os.path.join(images_directory, file)
+    filename = os.path.splitext(file)[0]
 
-        # Load the equirectangular image
-        print(f"Processing file: {filename}")
-        try:
-            equirectangular_image = np.array(Image.open(input_image_path))
-        except Exception as e:
-            print(f"Error opening image {input_image_path}: {e}")
-            return image_counter, f"Error opening image: {e}"
+    # Read the GPS tags from the JPEG header, then decode the pixels once at the
+    # smallest scale that still covers the face resolution
+    try:
+        with timed(timings, "exif"):
+            latitude, longitude = image_loader.read_gps_coordinates(input_image_path)
+    except Exception as e:
+        print(f"Error extracting GPS data from {filename}: {e}")
+        latitude, longitude = None, None  # Continue processing, but log the error
 
-        latitude = None
-        longitude = None
-        try:
-            # Get EXIF data and extract GPS info
-            original_image = Image.open(input_image_path)
-            exif_data = get_exif_data(original_image)
-            original_image.close()
-            if "GPSInfo" in exif_data:
-                latitude, longitude = get_coordinates(exif_data["GPSInfo"])
-        except Exception as e:
-            print(f"Error extracting GPS data from {filename}: {e}")
-            # Continue processing, but log the error
-
-        # Convert to cubemap
-        try:
-            cube_faces_dict = py360convert.e2c(
-                equirectangular_image,
-                face_w=2048,
-                mode='bilinear',
-                cube_format='dict'
+    print(f"Processing file: {filename}")
+    try:
+        # Only the band of rows the faces sample from is kept
+        with timed(timings, "decode"):
+            equirectangular_band, full_height, top = image_loader.load_equirectangular_band(
+                input_image_path, face_w, tuple(face_image_names)
             )
-        except Exception as e:
-            print(f"Error converting {filename} to cubemap: {e}")
-            return image_counter, f"Error converting to cubemap: {e}"
-
-        # Save left and right faces, and write to CSV
-        saved_faces = 0
-        for face_name, face_image_array in cube_faces_dict.items():
-            if face_name in ["L", "R"]:
-                face_image = Image.fromarray(face_image_array)
+    except Exception as e:
+        print(f"Error opening image {input_image_path}: {e}")
+        return [], f"Error opening image: {e}", []
+
+    # Project only the side faces
+    try:
+        with timed(timings, "projection"):
+            cube_faces_dict = cubemap_sampler.extract_faces(
+                equirectangular_band,
+                face_w=face_w,
+                faces=tuple(face_image_names),
+                full_height=full_height,
+                top=top
+            )
+    except Exception as e:
+        print(f"Error converting {filename} to cubemap: {e}")
+        return [], f"Error converting to cubemap: {e}", []
+
+    # Save left and right faces
+    rows = []
+    face_arrays = []
+    for face_name, face_image_array in cube_faces_dict.items():
+        face_image_name = face_image_names[face_name]
+        with timed(timings, "encode"):
+            if save_faces:
                 try:
-                    face_image_name = f"[{face_name}] {filename}.png"  # Changed to use face name in filename
-                    face_image.save(os.path.join(output_directory, face_image_name))
-                    saved_faces += 1
-                    # Write to CSV
-                    csv_path = os.path.join(output_directory, "preprocessed.csv")
-                    with open(csv_path, 'a', newline='') as csvfile:
-                        writer = csv.writer(csvfile)
-                        writer.writerow([face_image_name, latitude, longitude])
+                    face_store.save_face(
+                        face_image_array, os.path.join(output_directory, face_image_name), face_format, encode_level
+                    )
                 except Exception as e:
                     print(f"Error saving cubemap face {face_name} for {filename}: {e}")
-                    return image_counter, f"Error saving cubemap face: {e}"
-        if saved_faces>0:
-            image_counter += saved_faces #increment image counter by the number of saved faces
-            print(f"Left and Right cubemap faces saved for {filename} to {output_directory}")
-            return image_counter, None
-        else:
-            return image_counter, "No faces saved"
-    return image_counter, None
+                    # Remove the faces already saved, so the image leaves nothing behind
+                    for row in rows:
+                        face_path = os.path.join(output_directory, row[0])
+                        if os.path.exists(face_path):
+                            os.remove(face_path)
+                    return [], f"Error saving cubemap face: {e}", []
+            if return_faces:
+                face_arrays.append(face_store.to_bgr(face_image_array))
+        rows.append([face_image_name, latitude, longitude])
+
+    if save_faces:
+        print(f"Left and Right cubemap faces saved for {filename} to {output_directory}")
+    return rows, None, face_arrays
 
 
 
@@ -159,129 +158,368 @@ def process_image(args):
 ImageFile.MAX_IMAGE_PIXELS = 200000000
 
 
-def rename_preprocessed_images(output_directory):
+def bounded_imap_unordered(pool, func, iterable, max_pending, cost=None, budget=None):
     """
-    Renames the processed image files in the output directory to "0001.png", "0002.png", etc.,
-    and updates the corresponding filenames in the preprocessed.csv file.
+    Like pool.imap_unordered, but pulls from the iterable lazily and never keeps
+    more than max_pending tasks queued on the pool. (item, result) pairs are yielded
+    as soon as they complete; a task that raised yields its exception as the result.
+
+    With a cost function and a budget, an item is only submitted once the total cost of
+    the unfinished items leaves room for it. An item is always admitted when nothing
+    else is running, so one that exceeds the budget on its own still runs (alone).
 
     Args:
-        output_directory (str): The path to the directory containing the preprocessed images
-                                and the preprocessed.csv file.
+        pool (multiprocessing.pool.Pool): The worker pool to submit to.
+        func (callable): The function to run on each item.
+        iterable (iterable): The items to process.
+        max_pending (int): The maximum number of submitted but unfinished tasks.
+        cost (callable, optional): Returns the estimated cost (e.g. memory) of an item.
+        budget (float, optional): The maximum total cost of the unfinished items.
     """
-    print("Renaming preprocessed images...")
-    csv_path = os.path.join(output_directory, "preprocessed.csv")
-    temp_csv_path = os.path.join(output_directory, "temp_preprocessed.csv")  # Create a temporary CSV file
+    done = queue.Queue()
+    pending = {}  # id(item) -> cost of the submitted but unfinished items
+    in_flight = 0
+    for item in iterable:
+        item_cost = cost(item) if cost else 0
+        while pending and (len(pending) >= max_pending or (budget is not None and in_flight + item_cost > budget)):
+            finished_item, result = done.get()
+            in_flight -= pending.pop(id(finished_item))
+            yield finished_item, result
+        pool.apply_async(
+            func, (item,),
+            callback=lambda result, item=item: done.put((item, result)),
+            error_callback=lambda error, item=item: done.put((item, error))
+        )
+        pending[id(item)] = item_cost
+        in_flight += item_cost
+    while pending:
+        finished_item, result = done.get()
+        in_flight -= pending.pop(id(finished_item))
+        yield finished_item, result
+
+
+def estimate_peak_memory(image_path, face_w=FACE_W, faces=cubemap_sampler.SIDE_FACES):
+    """
+    Estimates the peak memory of converting one image from its header alone.
 
-    # Create a dictionary to store the old and new file names from the CSV
-    old_new_names = {}
-    image_counter = 1
+    Counts the full panorama as decoded at its draft scale, the band of rows cut out of
+    it and the array copy np.asarray makes of that band (see
+    image_loader.load_equirectangular_band) and, per face, the output array, one more
+    copy for encoding or streaming, and the fixed-point remap table (6 bytes per pixel).
 
-    try:
-        # Read the original CSV file and store the old and new names
-        with open(csv_path, 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader)  # Read the header
-            for row in reader:
-                old_image_name = row[0]
-                new_image_name = f"{image_counter:04d}.png"
-                old_new_names[old_image_name] = new_image_name
-                image_counter += 1
-
-        # Rename the image files and create a new CSV with updated names
-        with open(csv_path, 'r', newline='') as csvfile, \
-                open(temp_csv_path, 'w', newline='') as temp_csvfile:
-
-            reader = csv.reader(csvfile)
-            writer = csv.writer(temp_csvfile)
-
-            writer.writerow(header)  # Write the header to the new CSV
-
-            for row in reader:
-                old_image_name = row[0]
-                latitude = row[1]
-                longitude = row[2]
-                if old_image_name in old_new_names:
-                    new_image_name = old_new_names[old_image_name]
-                    # Rename the file
-                    old_file_path = os.path.join(output_directory, old_image_name)
-                    new_file_path = os.path.join(output_directory, new_image_name)
-                    try:
-                        os.rename(old_file_path, new_file_path)
-                    except Exception as e:
-                        print(f"Error renaming file {old_image_name} to {new_image_name}: {e}")
-                        new_image_name = old_image_name #keep the old name if renaming fails
-
-                    writer.writerow([new_image_name, latitude, longitude])
-                else:
-                    writer.writerow(row)  # Keep the original row if filename not found (shouldn't happen)
-
-        # Replace the original CSV with the temporary CSV
-        os.remove(csv_path)
-        os.rename(temp_csv_path, csv_path)
-
-        print("Images renamed and CSV updated successfully.")
+    Args:
+        image_path (str): Path to the image file.
+        face_w (int): The width of the cube faces.
+        faces (tuple): The faces that will be projected.
 
-    except Exception as e:
-        print(f"An error occurred during renaming: {e}")
+    Returns:
+        int: The estimated peak memory in bytes.
+    """
+    width, height, bands = image_loader.decoded_size(image_path, face_w)
+    top, bottom = cubemap_sampler.source_rows(height, width, face_w, tuple(faces))
+    decode = height * width * bands
+    band = (bottom - top) * width * bands
+    return decode + 2 * band + len(faces) * face_w * face_w * (2 * bands + 6)
+
+
+def process_image_with_stats(args):
+    """Runs process_image and also returns its stage timings and the worker's pid and peak RSS in bytes."""
+    timings = {}
+    result = process_image(args, timings)
+    return result, timings, os.getpid(), memory_stats.peak_rss_bytes()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Returns the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_preprocess_index(output_directory):
+    """
+    Loads the index of previously preprocessed images.
+
+    The index maps a key built from the source file's content hash, the face width, the
+    face set and the face encoding to the source file it came from (name, size, mtime)
+    and the manifest rows of its saved faces. Further byte-identical copies of an image
+    get the same key with "#1", "#2", ... appended, in file order.
+
+    Args:
+        output_directory (str): The 'Preprocessed' directory.
+
+    Returns:
+        dict: The index entries, empty if there is no (readable) index yet.
+    """
+    index_path = os.path.join(output_directory, INDEX_FILE_NAME)
+    try:
+        with open(index_path, 'r') as f:
+            return json.load(f).get("entries", {})
+    except (OSError, ValueError) as e:
+        if os.path.exists(index_path):
+            print(f"Ignoring unreadable preprocessing index {index_path}: {e}")
+        return {}
 
 
+def save_preprocess_index(output_directory, entries):
+    """Writes the preprocessing index, replacing the old one atomically."""
+    index_path = os.path.join(output_directory, INDEX_FILE_NAME)
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({"entries": entries}, f, indent=1)
+    os.replace(temp_path, index_path)
 
 
-def process_images(project_directory):
+def process_images(project_directory, workers=None, face_format="png", encode_level=None,
+                   face_queue=None, keep_faces=True, memory_budget_mb=None, resolution=None):
     """
     Processes images in the given project directory, converts them to cubemap
     faces, saves left and right faces, and saves coordinates to a CSV file.
 
+    A single pool of warm workers is reused for the whole directory, and images are
+    streamed to it so a slow panorama never holds back the rest. Images whose content,
+    face width and face set match a previous run keep their existing faces; only new
+    or changed images are converted.
+
+    With a face_queue, every face is also handed over in manifest order as an
+    (image_name, latitude, longitude, bgr_face) tuple, so detection can consume the faces
+    without reading them back from disk. Put blocks while the queue is full.
+
+    Work is admitted so that the estimated peak memory of the images being converted
+    (see estimate_peak_memory) stays within the memory budget.
+
     Args:
         project_directory (str): The path to the project directory.
+        workers (int, optional): The number of worker processes. Defaults to the CPU count.
+        face_format (str): The format to save the faces in: "png", "webp" (lossless),
+                           "jpeg" or "npy" (raw uint8, memory-mapped when read).
+        encode_level (int, optional): The encoder setting for that format, see
+                                      face_store.DEFAULT_LEVELS.
+        face_queue (queue.Queue, optional): Queue to stream the faces to.
+        keep_faces (bool): Whether newly converted faces are written to disk. When False
+                           (only useful with a face_queue), 'Preprocessed', its manifest
+                           and its index are left untouched.
+        memory_budget_mb (float, optional): The memory the images being converted may use
+                                            together, in MB. Defaults to half the physical memory.
+        resolution (int, optional): The face width, see resolution_policy.py.
+
+    Returns:
+        dict: A summary with the number of images and faces, the peak RSS of every worker,
+              the wall-clock seconds and the seconds spent per stage (see STAGES). The
+              worker stages are summed over all workers; "manifest" is the time this
+              process spent hashing sources and writing the manifest and index. Without
+              an 'images' directory, nothing is processed and all counts are zero.
     """
+    start_time = time.perf_counter()
+    stage_seconds = dict.fromkeys(STAGES, 0.0)
     print(f"Processing images in directory: {project_directory}")
     images_directory = os.path.join(project_directory, "images")
     output_directory = os.path.join(project_directory, "Preprocessed")
 
     if not os.path.exists(images_directory):
         print(f"Error: 'images' directory not found in {project_directory}")
-        return
-
-    image_files = [
+        return {
+            "images": 0,
+            "converted_images": 0,
+            "faces": 0,
+            "worker_peak_rss": {},
+            "seconds": time.perf_counter() - start_time,
+            "stage_seconds": stage_seconds,
+        }
+
+    image_files = sorted(
         file for file in os.listdir(images_directory)
         if file.lower().endswith(".jpg") or file.lower().endswith(".jpeg")
-    ]
-
-    batch_size = 5
-
-    image_counter = 1
-
-    context = get_context("spawn")
-    for i in range(0, len(image_files), batch_size):
-        batch = image_files[i:i + batch_size]
-        with context.Pool() as pool:
-            results = pool.map(
-                process_image,
-                [(file, images_directory, output_directory, image_counter) for file in batch]
-            )
+    )
+
+    faces = cubemap_sampler.SIDE_FACES
+    face_w = resolution_policy.face_width(resolution)
+    if face_format not in face_store.FACE_FORMATS:
+        raise ValueError(f"Unsupported face format: {face_format}")
+    if encode_level is None:
+        encode_level = face_store.DEFAULT_LEVELS[face_format]
+    encoding = face_format if encode_level is None else f"{face_format}{encode_level}"
+
+    previous_entries = load_preprocess_index(output_directory)
+    known_digests = {
+        (entry["source"], entry["size"], entry["mtime_ns"]): key.split(":")[0]
+        for key, entry in previous_entries.items()
+    }
+
+    # Key every image by its content; unchanged files (same name, size and mtime) reuse
+    # their recorded hash instead of being read again
+    file_keys = {}
+    file_stats = {}
+    copies = {}
+    with timed(stage_seconds, "manifest"):
+        for file in image_files:
+            stat = os.stat(os.path.join(images_directory, file))
+            file_stats[file] = (stat.st_size, stat.st_mtime_ns)
+            digest = known_digests.get((file, stat.st_size, stat.st_mtime_ns))
+            if digest is None:
+                digest = file_digest(os.path.join(images_directory, file))
+            key = f"{digest}:{face_w}:{''.join(faces)}:{encoding}"
+            # Byte-identical copies get an entry (and faces) of their own, numbered in file order
+            copies[key] = copies.get(key, 0) + 1
+            file_keys[file] = key if copies[key] == 1 else f"{key}#{copies[key] - 1}"
+
+    entries = {}
+    finished = {}
+    pending_files = []
+    for index, file in enumerate(image_files):
+        key = file_keys[file]
+        entry = previous_entries.get(key)
+        if entry and all(os.path.exists(os.path.join(output_directory, row[0])) for row in entry["rows"]):
+            entries[key] = dict(entry, source=file, size=file_stats[file][0], mtime_ns=file_stats[file][1])
+            finished[index] = (entry["rows"], None)
+        else:
+            entries[key] = None
+            pending_files.append(file)
+
+    # Remove the faces of images that were deleted or changed since the last run
+    kept_names = {row[0] for entry in entries.values() if entry for row in entry["rows"]}
+    for key, entry in previous_entries.items():
+        for row in entry["rows"]:
+            if keep_faces and row[0] not in kept_names and os.path.exists(os.path.join(output_directory, row[0])):
+                os.remove(os.path.join(output_directory, row[0]))
+
+    # New output names ("0001.png", "0002.png", ...) are fixed up front, continuing after
+    # the highest number still in use, so no rename pass is needed afterwards. Without
+    # keep_faces the stale faces stay on disk, so their numbers are not reused either:
+    # a streamed face must never share its name with a different face in 'Preprocessed'
+    used_names = kept_names if keep_faces else {row[0] for entry in previous_entries.values() for row in entry["rows"]}
+    kept_numbers = [os.path.splitext(name)[0] for name in used_names]
+    next_number = max((int(number) for number in kept_numbers if number.isdigit()), default=0) + 1
+    tasks = []
+    for file in pending_files:
+        tasks.append((file, images_directory, output_directory, {
+            face_name: face_store.face_file_name(f"{next_number + offset:04d}", face_format)
+            for offset, face_name in enumerate(faces)
+        }, face_format, encode_level, keep_faces, face_queue is not None, face_w))
+        next_number += len(faces)
+    file_indices = {file: index for index, file in enumerate(image_files)}
+
+    print(f"Reusing faces of {len(image_files) - len(pending_files)} images, converting {len(pending_files)} images.")
+
+    workers = workers or os.cpu_count() or 1
+    saved_faces = 0
+
+    if memory_budget_mb is None:
+        physical_memory = memory_stats.total_physical_memory()
+        memory_budget = physical_memory // 2 if physical_memory else None
+    else:
+        memory_budget = memory_budget_mb * 1024 * 1024
+    memory_estimates = {}
+    for file, *_ in tasks:
+        try:
+            memory_estimates[file] = estimate_peak_memory(os.path.join(images_directory, file), face_w, faces)
+        except Exception:
+            memory_estimates[file] = 0  # Unreadable header, process_image will report the error
+    if memory_budget:
+        print(f"Memory budget for conversion: {memory_budget / 2**20:.0f} MB")
+    worker_peak_rss = {}
+
+    # Workers hand their rows back here and this single writer streams the manifest in
+    # file order, holding back results that finish early until their turn comes up
+    csv_path = os.path.join(output_directory, "preprocessed.csv")
+    next_index = 0
+
+    with (open(csv_path, 'w', newline='') if keep_faces else contextlib.nullcontext()) as csvfile:
+        writer = csv.writer(csvfile) if keep_faces else None
+        if writer:
+            writer.writerow(["image_name", "latitude", "longitude"])
+
+        def flush():
+            nonlocal next_index, saved_faces
+            while next_index in finished:
+                rows, face_arrays = finished.pop(next_index)
+                if writer:
+                    with timed(stage_seconds, "manifest"):
+                        writer.writerows(rows)
+                if face_queue is not None:
+                    if face_arrays is None:  # Reused faces are read back from disk
+                        face_arrays = [face_store.load_face(os.path.join(output_directory, row[0])) for row in rows]
+                    for (image_name, latitude, longitude), face in zip(rows, face_arrays):
+                        face_queue.put((image_name, latitude, longitude, face))
+                saved_faces += len(rows)
+                next_index += 1
+
+        flush()
+        if tasks:
+            context = get_context("spawn")
+            with context.Pool(processes=min(workers, len(tasks))) as pool:
+                results = bounded_imap_unordered(
+                    pool, process_image_with_stats, tasks, 2 * workers,
+                    cost=lambda task: memory_estimates[task[0]], budget=memory_budget
+                )
+                for processed, ((file, *_), outcome) in enumerate(results, 1):
+                    if isinstance(outcome, Exception):
+                        print(f"Error during processing {file}: {outcome}")
+                        outcome = (([], None, []), {}, None, None)
+                    (rows, error_message, face_arrays), timings, pid, peak_rss = outcome
+                    for stage, seconds in timings.items():
+                        stage_seconds[stage] += seconds
+                    if pid is not None:
+                        worker_peak_rss[pid] = max(worker_peak_rss.get(pid, 0), peak_rss or 0)
+                    if error_message:
+                        print(f"Error during processing {file}: {error_message}")
+
+                    key = file_keys[file]
+                    if len(rows) == len(faces):
+                        entries[key] = {
+                            "source": file, "size": file_stats[file][0], "mtime_ns": file_stats[file][1], "rows": rows
+                        }
+                    else:
+                        # A failed image contributes no rows (process_image removes faces it saved)
+                        del entries[key]
+                        rows, face_arrays = [], []
+                    finished[file_indices[file]] = (rows, face_arrays)
+                    flush()
+                    print(f"\nProcessed image {processed}/{len(tasks)}\n")
+
+    if keep_faces:
+        with timed(stage_seconds, "manifest"):
+            save_preprocess_index(output_directory, {key: entry for key, entry in entries.items() if entry})
+        print(f"Manifest lists {saved_faces} faces from {len(image_files)} images.")
+    else:
+        print(f"Streamed {saved_faces} faces from {len(image_files)} images.")
+    for pid, peak_rss in sorted(worker_peak_rss.items()):
+        print(f"Worker {pid}: peak RSS {peak_rss / 2**20:.0f} MB")
 
-        for result in results:
-            if isinstance(result, tuple):
-                image_counter, error_message = result
-                if error_message:
-                    print(f"Error during processing: {error_message}")
-        print(f"\nProcessed batch {i // batch_size + 1}/{ (len(image_files) + batch_size - 1) // batch_size}\n")
-    rename_preprocessed_images(output_directory) #call the function here
+    return {
+        "images": len(image_files),
+        "converted_images": len(tasks),
+        "faces": saved_faces,
+        "worker_peak_rss": worker_peak_rss,
+        "seconds": time.perf_counter() - start_time,
+        "stage_seconds": stage_seconds,
+    }
 
 
 
-def run_data_preprocessing(project_directory):
+def run_data_preprocessing(project_directory, workers=None, face_format="png", encode_level=None, resolution=None):
     """
     Encapsulates the entire data preprocessing sequence.
 
     Args:
         project_directory (str): The path to the project directory.
+        workers (int, optional): The number of worker processes. Defaults to the CPU count.
+        face_format (str): The format to save the faces in ("png", "webp", "jpeg" or "npy").
+        encode_level (int, optional): The encoder setting for that format.
+        resolution (int, optional): The face width, see resolution_policy.py.
+
+    Returns:
+        dict: The summary of process_images.
     """
     print("Starting data preprocessing...")
     preprocessed_directory = prepare_directory(project_directory)
-    process_images(project_directory)
+    summary = process_images(
+        project_directory, workers=workers, face_format=face_format, encode_level=encode_level, resolution=resolution
+    )
     print("Data preprocessing complete.")
+    return summary
 
 
 
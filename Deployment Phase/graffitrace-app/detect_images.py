@@ -3,100 +3,536 @@ import shutil
 import cv2
 import torch
 import csv
+import json
+import time
 import numpy as np
-from detectron2.engine import DefaultPredictor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from detectron2.config import get_cfg
 from detectron2.model_zoo import model_zoo
+from detectron2.modeling import build_model
+import detectron2.data.transforms as T
 from detectron2.utils.visualizer import Visualizer
 from detectron2.data import MetadataCatalog
 import pandas as pd
 import warnings
+import face_store
+import box_renderer
+import detection_cache
+import detection_store
+from data_preprocessing import timed
+import cpu_inference
+import quantization
+import resolution_policy
+import gate_classifier
+import near_duplicates
 
 # Suppress Warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+# Number of faces sent through the model in one forward pass
+DEFAULT_BATCH_SIZE = 4
+
+# Threads reading and preprocessing faces ahead of the model, and drawing the results
+DECODE_WORKERS = 2
+WRITER_WORKERS = 2
+
+# Inference backends, see build_predictor
+BACKENDS = ("eager", "cpu-optimized", "onnx")
+
+# Score a detection needs to count in results.csv (the model itself keeps everything down
+# to detection_store.FLOOR_THRESHOLD, so results can be rebuilt for stricter thresholds)
+DETECTION_THRESHOLD = 0.55
+
+# Per-face stages timed by detect_faces, written to results/timings.jsonl
+DETECTION_STAGES = ("decode", "cache", "gate", "hash", "preprocess", "forward", "filter", "render", "write")
+
+# What faces rejected by the gate are recorded with (see detection_cache.instances_from_entry)
+NO_DETECTIONS = {"boxes": [], "scores": [], "classes": []}
+
+# Result image renderers and their default output scale
+RENDERERS = {
+    "visualizer": 1.2,  # detectron2's Visualizer (matplotlib)
+    "opencv": 1.0,      # box_renderer: plain boxes and scores, native resolution
+}
+
 # Load the model and prepare the predictor
-def setup_cfg(model_path):
+# (int8 models written by detectron2_model/quantize_model.py only run on the CPU;
+# the test-time size follows the resolution setting, see resolution_policy.py)
+def setup_cfg(model_path, resolution=None):
     cfg = get_cfg()
     cfg.merge_from_file(model_zoo.get_config_file("COCO-Detection/faster_rcnn_R_101_FPN_3x.yaml"))
     cfg.MODEL.WEIGHTS = model_path
     cfg.MODEL.ROI_HEADS.NUM_CLASSES = 1
-    cfg.MODEL.DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.55
+    resolution_policy.apply_to_cfg(cfg, resolution)
+    quantized = quantization.read_quantization_info(model_path) is not None
+    cfg.MODEL.DEVICE = "cuda" if torch.cuda.is_available() and not quantized else "cpu"
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = detection_store.FLOOR_THRESHOLD
     return cfg
 
-# Detect a single image
-def detect_image(image_path, predictor, graffiti_metadata, instance_dir, csv_writer, graffiti_id, latitude, longitude, target_place):
-    image = cv2.imread(image_path)
-    outputs = predictor(image)
-    instances = outputs["instances"].to("cpu")
+# Run several images through the model at once
+class BatchPredictor:
+    """
+    Like DefaultPredictor, but takes a list of BGR images and runs them through the
+    model as one batch, so the backbone processes them together. preprocess and
+    predict can also be called separately, e.g. to prepare inputs on other threads.
+
+    With cpu_optimized, the model is prepared for CPU inference after loading (see
+    cpu_inference.optimize_for_cpu) and run under torch.inference_mode. An already
+    loaded model (e.g. one shared between processes) can be passed in instead.
+    """
+
+    def __init__(self, cfg, cpu_optimized=False, num_threads=None, model=None):
+        self.cfg = cfg.clone()
+        if model is None:
+            model = build_model(self.cfg)
+            quantization.load_weights(model, cfg.MODEL.WEIGHTS)
+        self.model = model
+        self.model.eval()
+        if cpu_optimized:
+            cpu_inference.optimize_for_cpu(self.model, num_threads)
+        self.grad_mode = torch.inference_mode if cpu_optimized else torch.no_grad
+        self.aug = T.ResizeShortestEdge(
+            [cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST
+        )
+        self.input_format = cfg.INPUT.FORMAT
+
+    def preprocess(self, original_image):
+        """Resizes one (H, W, C) BGR image and turns it into a model input dict."""
+        if self.input_format == "RGB":
+            original_image = original_image[:, :, ::-1]
+        height, width = original_image.shape[:2]
+        image = self.aug.get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1)).to(self.cfg.MODEL.DEVICE)
+        return {"image": image, "height": height, "width": width}
+
+    def predict(self, inputs):
+        """Runs a list of preprocessed inputs through the model in one forward pass."""
+        with self.grad_mode():
+            return self.model(inputs)
+
+    def __call__(self, original_images):
+        """
+        Args:
+            original_images (list): (H, W, C) BGR images.
+
+        Returns:
+            list: One {"instances": Instances} dict per image, in the same order.
+        """
+        return self.predict([self.preprocess(image) for image in original_images])
+
+# Build the predictor for the chosen backend
+def build_predictor(cfg, backend="eager", num_threads=None):
+    """
+    Args:
+        cfg (CfgNode): The config from setup_cfg.
+        backend (str): "eager" runs the detectron2 model as is, on CUDA when available.
+                       "cpu-optimized" runs it on the CPU with folded batch norms,
+                       channels_last weights and a traced backbone.
+                       "onnx" runs a model exported by onnx_backend.export_onnx (the
+                       config's weights must be the .onnx file) with ONNX Runtime.
+        num_threads (int, optional): The intra-op thread count for "cpu-optimized" and "onnx".
+
+    Returns:
+        BatchPredictor: The predictor (an onnx_backend.OnnxPredictor for "onnx").
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == "onnx":
+        import onnx_backend  # Only needed (and only requires onnxruntime) for this backend
+        return onnx_backend.OnnxPredictor(cfg, num_threads)
+    if backend == "cpu-optimized":
+        cfg = cfg.clone()
+        cfg.MODEL.DEVICE = "cpu"
+        return BatchPredictor(cfg, cpu_optimized=True, num_threads=num_threads)
+    return BatchPredictor(cfg)
 
-    # Filter instances by confidence score
-    mask = instances.scores >= 0.55
-    filtered_instances = instances[mask]
+# Group an iterable into lists of at most batch_size items
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    v = Visualizer(image[:, :, ::-1], metadata=graffiti_metadata, scale=1.2)
-    v = v.draw_instance_predictions(filtered_instances)  # Use filtered instances
-    result_image = v.get_image()[:, :, ::-1]
+# Map func over items on a thread pool, keeping up to depth results ready ahead, in order
+def prefetch(func, items, pool, depth):
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
-    num_graffiti_instances = len(filtered_instances) # Use filtered instances
+# Run prepared faces through the model in batches, reusing cached detections, in order
+def predict_in_order(prepared, predictor, batch_size, cache=None):
+    """
+    Args:
+        prepared (iterable): (face, digest, inputs, cached_instances) tuples; inputs is
+                             None for faces whose detections came from the cache.
+        predictor: The predictor the inputs were prepared for.
+        batch_size (int): The number of uncached faces per forward pass.
+        cache (DetectionCache, optional): Receives the detections of the uncached faces.
 
-    if num_graffiti_instances > 0: # Only save if graffiti is detected
-        result_image_path = os.path.join(instance_dir, f"{graffiti_id}.jpg")
+    Yields:
+        tuple: (face, instances, forward_seconds) in the order the faces arrived, where
+               forward_seconds is the face's share of its batch's forward pass (0.0 if cached).
+    """
+    pending = []
+    misses = 0
+    for item in prepared:
+        pending.append(item)
+        misses += item[3] is None
+        if misses < batch_size:
+            continue
+        yield from _finish_batch(pending, predictor, cache)
+        pending = []
+        misses = 0
+    if pending:
+        yield from _finish_batch(pending, predictor, cache)
+
+def _finish_batch(pending, predictor, cache):
+    misses = [inputs for _, _, inputs, cached in pending if cached is None]
+    start = time.perf_counter()
+    outputs = iter(predictor.predict(misses) if misses else [])
+    forward_seconds = (time.perf_counter() - start) / len(misses) if misses else 0.0
+    for face, digest, _, cached in pending:
+        if cached is not None:
+            yield face, cached, 0.0
+            continue
+        instances = next(outputs)["instances"]
+        if cache is not None:
+            cache.put(digest, instances)
+        yield face, instances, forward_seconds
+
+# Iterate over items, adding the time spent waiting for each one to timings[stage]
+def waited(items, timings, stage):
+    items = iter(items)
+    while True:
+        with timed(timings, stage):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        yield item
+
+# Match faces against the recent faces sent to the model, in arrival order and before
+# they are batched. Matched faces skip the model; as their source may still be waiting in
+# the same batch, they carry a placeholder that detect_faces swaps for the source's
+# detections, which are known by the time the face comes out of predict_in_order.
+def reuse_near_duplicates(prepared, duplicates):
+    for face, digest, inputs, cached in prepared:
+        image_name, latitude, longitude, image, timings, face_hash, _ = face
+        match = duplicates.find(face_hash, latitude, longitude) if cached is None else None
+        record = None
+        if match is not None and not match["verify"]:
+            timings["duplicate_of"] = match["image_name"]
+            cached = detection_cache.instances_from_entry(NO_DETECTIONS, image.shape[:2])
+        elif cached is None:
+            if match is not None:
+                timings["verified_against"] = match["image_name"]
+            record = duplicates.register(face_hash, latitude, longitude, image_name)
+        yield (image_name, latitude, longitude, image, timings, record, match), digest, inputs, cached
+
+# Keep the instances above the confidence threshold
+def filter_instances(instances, threshold=DETECTION_THRESHOLD):
+    instances = instances.to("cpu")
+    mask = instances.scores >= threshold
+    return instances[mask]
+
+# Draw the detections on the image and save it
+# (the drawing and writing time are added to timings["render"] and timings["write"], if given)
+def render_detections(image, instances, graffiti_metadata, result_image_path, renderer="visualizer", render_scale=None,
+                      timings=None):
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    scale = RENDERERS[renderer] if render_scale is None else render_scale
+
+    with timed(timings, "render"):
+        if renderer == "opencv":
+            result_image = box_renderer.draw_boxes(
+                image, instances.pred_boxes.tensor.numpy(), instances.scores.numpy(), scale=scale
+            )
+        else:
+            v = Visualizer(image[:, :, ::-1], metadata=graffiti_metadata, scale=scale)
+            v = v.draw_instance_predictions(instances)
+            result_image = v.get_image()[:, :, ::-1]
+    with timed(timings, "write"):
         cv2.imwrite(result_image_path, result_image)
-        print(f"\nResult saved to {result_image_path}")
-        print(f"\nGraffiti ID: {graffiti_id}")
-        print(f"Source File Name: {os.path.basename(image_path)}")
-        print(f"Place: {target_place}")
-        print(f"Latitude: {latitude}")
-        print(f"Longitude: {longitude}")
-        print(f"Num Graffiti Instances: {num_graffiti_instances}")
 
-        csv_writer.writerow([
-            graffiti_id, os.path.basename(image_path), target_place, latitude, longitude, num_graffiti_instances
-        ])
-    else:
-        print(f"\nNo graffiti detected in {os.path.basename(image_path)}")
-    return num_graffiti_instances #return the number of instances
+# Record one detected image in results.csv
+def record_detections(image_name, num_graffiti_instances, csv_writer, graffiti_id, latitude, longitude, target_place):
+    print(f"\nGraffiti ID: {graffiti_id}")
+    print(f"Source File Name: {image_name}")
+    print(f"Place: {target_place}")
+    print(f"Latitude: {latitude}")
+    print(f"Longitude: {longitude}")
+    print(f"Num Graffiti Instances: {num_graffiti_instances}")
 
-# Process all images
-def detect_images_in_directory(image_dir, preprocessed_csv, output_dir, instance_dir, model_path, target_place):
+    csv_writer.writerow([
+        graffiti_id, image_name, target_place, latitude, longitude, num_graffiti_instances
+    ])
+
+# List the faces in preprocessed.csv without reading them
+def iter_manifest_rows(image_dir, preprocessed_csv):
+    """Yields (image_name, latitude, longitude, image_path) for every face file in the manifest."""
     preprocessed_data = pd.read_csv(preprocessed_csv)
-    with open(os.path.join(output_dir, 'results.csv'), mode='w', newline='') as f:
+    for _, row in preprocessed_data.iterrows():
+        image_name = row['image_name']
+        image_path = os.path.join(image_dir, image_name)
+        if not os.path.exists(image_path):
+            print(f"Warning: Image file not found: {image_path}")
+            continue
+        yield image_name, row['latitude'], row['longitude'], image_path
+
+# Detect graffiti in a stream of faces
+def detect_faces(faces, output_dir, instance_dir, model_path, target_place, batch_size=DEFAULT_BATCH_SIZE,
+                 decode_workers=DECODE_WORKERS, writer_workers=WRITER_WORKERS, renderer="visualizer", render_scale=None,
+                 backend="eager", num_threads=None, resolution=None, cache_dir=None,
+                 threshold=DETECTION_THRESHOLD, screen_threshold=None, gate_path=None, gate_threshold=None,
+                 skip_duplicates=False):
+    """
+    Runs detection on (image_name, latitude, longitude, face) tuples and writes results.csv.
+
+    The face is a BGR array (e.g. straight from preprocessing, see streaming_pipeline) or
+    the path of a face file (iter_manifest_rows). The work is split into three stages so
+    the model is never left waiting:
+
+    - decode_workers threads read and preprocess the next faces ahead of the model,
+    - this thread runs them through the model batch_size at a time and assigns the
+      graffiti IDs and results.csv rows in the order the faces arrived,
+    - writer_workers threads draw and save the result images, with the given renderer
+      (see RENDERERS) at render_scale (default: the renderer's own scale).
+
+    The model runs on the given inference backend (see build_predictor), at the given
+    resolution setting (see resolution_policy.py). With a screen_threshold, every face is
+    screened at cascade.SCREEN_SIZE first and only faces whose top score reaches the
+    screen_threshold are run at full resolution (see cascade.CascadePredictor).
+
+    With a gate_path, a gate_classifier.GateClassifier looks at every face first, and
+    faces it rejects (graffiti probability below gate_threshold, default: the threshold
+    calibrated into the gate file) skip the detector and are recorded without detections.
+    Gated faces are not added to the detection cache, and lowering the threshold later
+    cannot bring back detections on them.
+
+    With skip_duplicates, a face whose perceptual hash and capture point are close to
+    those of one of the last faces run through the model (see near_duplicates.py) reuses
+    that face's detections instead. A sample of these faces is run anyway to check the
+    reuse; the skip rate and the sample are part of the timing summary.
+
+    With a cache_dir, the raw detections are kept in a detection_cache.DetectionCache
+    there, and faces already run with the same model and settings skip the model; their
+    results.csv rows and result images are rebuilt from the cache.
+
+    results.csv and the result images count the detections scoring at least threshold.
+    All detections down to detection_store.FLOOR_THRESHOLD are also written to
+    results/detections.npz, so detection_store.rebuild_results can redo results.csv for
+    another threshold without the model.
+
+    The time every face spends in each of DETECTION_STAGES is written to
+    results/timings.jsonl, and a summary (see summarize_timings) to
+    results/timings_summary.json.
+
+    Returns:
+        dict: The timing summary.
+    """
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    run_timings = {}
+    with timed(run_timings, "model_load"):
+        cfg = setup_cfg(model_path, resolution)
+        if screen_threshold is None:
+            predictor = build_predictor(cfg, backend, num_threads)
+        else:
+            import cascade
+            predictor = cascade.CascadePredictor(cfg, backend, num_threads, screen_threshold=screen_threshold)
+        gate = gate_classifier.GateClassifier(gate_path, gate_threshold) if gate_path else None
+    graffiti_metadata = MetadataCatalog.get("graffiti_train")
+    duplicates = near_duplicates.NearDuplicateIndex() if skip_duplicates else None
+    with timed(run_timings, "cache_load"):
+        # Screened runs keep different detections for the faces they screen out
+        variant = backend if screen_threshold is None else f"{backend}:screen{cascade.SCREEN_SIZE}@{screen_threshold}"
+        cache = detection_cache.DetectionCache(cache_dir, cfg, variant) if cache_dir else None
+
+    def prepare(face):
+        image_name, latitude, longitude, image = face
+        timings = {"face": image_name}
+        with timed(timings, "decode"):
+            if isinstance(image, str):
+                image = face_store.load_face(image)
+        if image is None:
+            print(f"Warning: Could not read image: {image_name}")
+            return None
+        digest = cached = inputs = None
+        if cache is not None:
+            with timed(timings, "cache"):
+                digest = detection_cache.face_digest(image)
+                cached = cache.get(digest, image.shape[:2])
+        timings["cached"] = cached is not None
+        if cached is None and gate is not None:
+            with timed(timings, "gate"):
+                timings["gated"] = not gate.passes(image)
+            if timings["gated"]:
+                cached = detection_cache.instances_from_entry(NO_DETECTIONS, image.shape[:2])
+        face_hash = None
+        if cached is None and duplicates is not None:
+            with timed(timings, "hash"):
+                face_hash = near_duplicates.phash(image)
+        if cached is None:
+            with timed(timings, "preprocess"):
+                inputs = predictor.preprocess(image)
+        return (image_name, latitude, longitude, image, timings, face_hash, None), digest, inputs, cached
+
+    with open(os.path.join(output_dir, 'results.csv'), mode='w', newline='') as f, \
+            ThreadPoolExecutor(decode_workers) as decode_pool, ThreadPoolExecutor(writer_workers) as writer_pool:
         csv_writer = csv.writer(f)
         csv_writer.writerow([
             "graffiti_id", "source_file_name", "place", "latitude", "longitude", "num_graffiti_instances"
         ])
 
-        cfg = setup_cfg(model_path)
-        predictor = DefaultPredictor(cfg)
         graffiti_id = 1
+        writes = deque()
+        records = []
+        table = detection_store.DetectionTable()
+        start_time = time.perf_counter()
+        prepared = (item for item in prefetch(prepare, faces, decode_pool, 2 * batch_size + decode_workers) if item)
+        prepared = waited(prepared, run_timings, "decode_wait")
+        if duplicates is not None:
+            prepared = reuse_near_duplicates(prepared, duplicates)
 
-        for _, row in preprocessed_data.iterrows():
-            image_name = row['image_name']
-            latitude = row['latitude']
-            longitude = row['longitude']
-            image_path = os.path.join(image_dir, image_name)
-            if not os.path.exists(image_path):
-                print(f"Warning: Image file not found: {image_path}")
+        for face, instances, forward_seconds in predict_in_order(prepared, predictor, batch_size, cache):
+            image_name, latitude, longitude, image, timings, record, match = face
+            if "duplicate_of" in timings:
+                instances = detection_cache.instances_from_entry(match["source"]["entry"], image.shape[:2])
+            timings["forward"] = forward_seconds
+            records.append(timings)
+
+            # Bound the images waiting to be drawn; this also surfaces writer errors early
+            with timed(run_timings, "write_wait"):
+                while writes and (writes[0].done() or len(writes) > 2 * writer_workers):
+                    writes.popleft().result()
+
+            with timed(timings, "filter"):
+                instances = instances.to("cpu")
+                table.add(
+                    image_name, latitude, longitude, instances.pred_boxes.tensor.numpy(), instances.scores.numpy(),
+                    instances.pred_classes.numpy()
+                )
+                filtered_instances = filter_instances(instances, threshold)
+                if record is not None:
+                    entry = detection_cache.entry_from_instances(instances)
+                    duplicates.complete(record, entry)
+                    if match is not None:
+                        duplicates.record_verification(image_name, match, entry, threshold)
+            num_graffiti_instances = len(filtered_instances)
+            timings["detections"] = num_graffiti_instances
+            if num_graffiti_instances == 0:
+                print(f"\nNo graffiti detected in {image_name}")
                 continue
 
-            num_graffiti_instances = detect_image( # added num_graffiti_instances
-                image_path, predictor, MetadataCatalog.get("graffiti_train"),
-                instance_dir, csv_writer, f"Graffiti {graffiti_id:05}",
-                latitude, longitude, target_place
-            )
-            if num_graffiti_instances > 0: #increment only if graffiti is detected
-                graffiti_id += 1
+            result_id = f"Graffiti {graffiti_id:05}"
+            result_image_path = os.path.join(instance_dir, f"{result_id}.jpg")
+            writes.append(writer_pool.submit(
+                render_detections, image, filtered_instances, graffiti_metadata,
+                result_image_path, renderer, render_scale, timings
+            ))
+            print(f"\nResult saved to {result_image_path}")
+            record_detections(image_name, num_graffiti_instances, csv_writer, result_id, latitude, longitude, target_place)
+            graffiti_id += 1
 
+        with timed(run_timings, "write_wait"):
+            while writes:
+                writes.popleft().result()
+        seconds = time.perf_counter() - start_time
 
+    table.save(output_dir, target_place, renderer, RENDERERS[renderer] if render_scale is None else render_scale)
+    detection_store.write_threshold(output_dir, threshold)
 
-# Main callable function
-def run_graffiti_detection(project_directory, model_path, target_place):
-    os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-    image_dir = os.path.join(project_directory, "Preprocessed")
-    preprocessed_csv = os.path.join(image_dir, "preprocessed.csv")
+    if cache is not None:
+        cache.save()
+        print(f"Reused cached detections for {cache.hits} faces.")
+
+    summary = summarize_timings(records, run_timings, seconds)
+    if gate is not None:
+        summary["gated_faces"] = sum(record.get("gated", False) for record in records)
+        print(f"The gate skipped the detector for {summary['gated_faces']} of {len(records)} faces.")
+    if duplicates is not None:
+        summary["near_duplicates"] = duplicates.summary(len(records))
+        print(f"Reused the detections of near-duplicates for {duplicates.reused} of {len(records)} faces "
+              f"({summary['near_duplicates']['skip_rate']:.0%}); "
+              f"{summary['near_duplicates']['verified_agreeing']} of {summary['near_duplicates']['verified']} "
+              f"verified near-duplicates agreed with the model.")
+    if screen_threshold is not None:
+        summary["escalated_faces"] = predictor.escalated
+        print(f"Screening sent {predictor.escalated} of {predictor.screened} faces on to full resolution.")
+    write_timings(output_dir, records, summary)
+    print_timing_summary(summary)
+    return summary
+
+# Add up the per-face timings of a detection run
+def summarize_timings(records, run_timings, seconds):
+    """
+    Args:
+        records (list): The per-face timing dicts written to timings.jsonl.
+        run_timings (dict): Seconds spent loading the model ("model_load") and the
+                            detection cache ("cache_load"), and waiting in the model thread
+                            for decoded faces ("decode_wait") and for the writers ("write_wait").
+        seconds (float): The wall-clock seconds of the detection loop, after loading.
+
+    Returns:
+        dict: Face counts, faces/sec, the run timings and the per-stage totals. The stage
+              totals are summed over all threads, so they can exceed the wall-clock time;
+              the wait times show which side held the model thread up.
+    """
+    return {
+        "faces": len(records),
+        "cached_faces": sum(record.get("cached", False) for record in records),
+        "faces_with_graffiti": sum(record.get("detections", 0) > 0 for record in records),
+        "seconds": seconds,
+        "faces_per_sec": len(records) / seconds if seconds > 0 else 0.0,
+        "model_load_seconds": run_timings.get("model_load", 0.0),
+        "cache_load_seconds": run_timings.get("cache_load", 0.0),
+        "decode_wait_seconds": run_timings.get("decode_wait", 0.0),
+        "write_wait_seconds": run_timings.get("write_wait", 0.0),
+        "stage_seconds": {stage: sum(record.get(stage, 0.0) for record in records) for stage in DETECTION_STAGES},
+    }
+
+# Write the per-face timings (one JSON object per line) and the summary to the results directory
+def write_timings(output_dir, records, summary):
+    with open(os.path.join(output_dir, "timings.jsonl"), 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    with open(os.path.join(output_dir, "timings_summary.json"), 'w') as f:
+        json.dump(summary, f, indent=4)
+
+# Print where the time of a detection run went
+def print_timing_summary(summary):
+    print(f"\nDetected {summary['faces']} faces in {summary['seconds']:.1f} s "
+          f"({summary['faces_per_sec']:.2f} faces/s, model loaded in {summary['model_load_seconds']:.1f} s)")
+    print(f"Model thread waited {summary['decode_wait_seconds']:.1f} s for decoded faces "
+          f"and {summary['write_wait_seconds']:.1f} s for result writers")
+    print("Stage totals: " + ", ".join(f"{stage} {seconds:.1f} s" for stage, seconds in summary["stage_seconds"].items()))
+
+# Process all images
+def detect_images_in_directory(image_dir, preprocessed_csv, output_dir, instance_dir, model_path, target_place,
+                               batch_size=DEFAULT_BATCH_SIZE, renderer="visualizer", render_scale=None,
+                               backend="eager", num_threads=None, resolution=None, cache_dir=None,
+                               threshold=DETECTION_THRESHOLD, screen_threshold=None, gate_path=None,
+                               gate_threshold=None, skip_duplicates=False):
+    return detect_faces(
+        iter_manifest_rows(image_dir, preprocessed_csv), output_dir, instance_dir, model_path, target_place,
+        batch_size=batch_size, renderer=renderer, render_scale=render_scale, backend=backend, num_threads=num_threads,
+        resolution=resolution, cache_dir=cache_dir, threshold=threshold, screen_threshold=screen_threshold,
+        gate_path=gate_path, gate_threshold=gate_threshold, skip_duplicates=skip_duplicates
+    )
+
+# Clear and recreate the results directory
+def prepare_results_directory(project_directory):
     output_dir = os.path.join(project_directory, "results")
     instance_dir = os.path.join(output_dir, "graffiti_instances")
 
@@ -104,8 +540,42 @@ def run_graffiti_detection(project_directory, model_path, target_place):
         shutil.rmtree(output_dir)
 
     os.makedirs(instance_dir)
+    return output_dir, instance_dir
+
+# Main callable function
+# (processes > 1 shards the faces over that many processes, see sharded_detection.py;
+# with use_cache, faces already run with the same model and settings are not run again,
+# see detection_cache.py; with a screen_threshold, faces are screened at low resolution
+# first, see cascade.py; with a gate_path, faces the gate classifier rejects skip the
+# detector, see gate_classifier.py; with skip_duplicates, near-identical consecutive faces
+# reuse each other's detections, see near_duplicates.py; returns the timing summary,
+# see summarize_timings)
+def run_graffiti_detection(project_directory, model_path, target_place, batch_size=DEFAULT_BATCH_SIZE,
+                           renderer="visualizer", render_scale=None, backend="eager", num_threads=None,
+                           resolution=None, processes=None, use_cache=True, threshold=DETECTION_THRESHOLD,
+                           screen_threshold=None, gate_path=None, gate_threshold=None, skip_duplicates=False):
+    os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+    image_dir = os.path.join(project_directory, "Preprocessed")
+    preprocessed_csv = os.path.join(image_dir, "preprocessed.csv")
+    output_dir, instance_dir = prepare_results_directory(project_directory)
+    cache_dir = project_directory if use_cache else None
+
+    if processes and processes > 1:
+        if backend != "eager" or screen_threshold is not None or gate_path or skip_duplicates:
+            raise ValueError("Sharded detection runs the eager model on every face; use processes=None for other modes")
+        import sharded_detection
+        return sharded_detection.detect_faces_sharded(
+            iter_manifest_rows(image_dir, preprocessed_csv), output_dir, instance_dir, model_path, target_place,
+            processes, batch_size=batch_size, renderer=renderer, render_scale=render_scale, resolution=resolution,
+            cache_dir=cache_dir, threshold=threshold
+        )
 
-    detect_images_in_directory(image_dir, preprocessed_csv, output_dir, instance_dir, model_path, target_place)
+    return detect_images_in_directory(
+        image_dir, preprocessed_csv, output_dir, instance_dir, model_path, target_place, batch_size=batch_size,
+        renderer=renderer, render_scale=render_scale, backend=backend, num_threads=num_threads,
+        resolution=resolution, cache_dir=cache_dir, threshold=threshold, screen_threshold=screen_threshold,
+        gate_path=gate_path, gate_threshold=gate_threshold, skip_duplicates=skip_duplicates
+    )
 
 # Example call
 if __name__ == "__main__":
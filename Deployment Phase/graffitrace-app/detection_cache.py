@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import torch
+from detectron2.structures import Boxes, Instances
+from data_preprocessing import file_digest
+
+# Holds the raw detections of earlier runs, next to (not inside) the 'results' directory
+CACHE_FILE_NAME = "detection_cache.json"
+
+
+def face_digest(image):
+    """Returns the SHA-1 hex digest of a face's pixels and shape, whatever format it was stored in."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha1(str(image.shape).encode())
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+def entry_from_instances(instances):
+    """Turns a face's Instances into a JSON-serialisable cache entry."""
+    instances = instances.to("cpu")
+    return {
+        "boxes": instances.pred_boxes.tensor.tolist(),
+        "scores": instances.scores.tolist(),
+        "classes": instances.pred_classes.tolist(),
+    }
+
+
+def instances_from_entry(entry, image_size):
+    """Turns a cache entry back into Instances of the given (height, width)."""
+    instances = Instances(image_size)
+    instances.pred_boxes = Boxes(torch.tensor(entry["boxes"], dtype=torch.float32).reshape(-1, 4))
+    instances.scores = torch.tensor(entry["scores"], dtype=torch.float32)
+    instances.pred_classes = torch.tensor(entry["classes"], dtype=torch.int64)
+    return instances
+
+
+class DetectionCache:
+    """
+    Raw per-face detections of earlier runs of a project, so a rerun only has to run
+    the model on faces it has not seen with the same model and settings.
+
+    Entries are grouped by a config key made of the model weights' content hash, the
+    inference backend and the detection settings (test sizes, score and NMS thresholds),
+    and within a group keyed by the face's pixel hash (see face_digest). Saving keeps
+    the groups of other configs, so switching back to an earlier model is free, but
+    drops the faces of the current group that were not seen in this run.
+    """
+
+    def __init__(self, project_directory, cfg, backend="eager"):
+        self.path = os.path.join(project_directory, CACHE_FILE_NAME)
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            if os.path.exists(self.path):
+                print(f"Ignoring unreadable detection cache {self.path}: {e}")
+            data = {}
+        self.models = data.get("models", {})
+        self.configs = data.get("configs", {})
+
+        self.config_key = ":".join(str(value) for value in (
+            self.model_digest(cfg.MODEL.WEIGHTS), backend, cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MAX_SIZE_TEST,
+            cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST, cfg.MODEL.ROI_HEADS.NMS_THRESH_TEST,
+        ))
+        self.previous = self.configs.get(self.config_key, {})
+        self.current = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def model_digest(self, model_path):
+        """Hashes the model weights, reusing the recorded hash while the file's size and mtime are unchanged."""
+        stat = os.stat(model_path)
+        known = self.models.get(os.path.abspath(model_path))
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["digest"]
+        digest = file_digest(model_path)
+        self.models[os.path.abspath(model_path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        return digest
+
+    def get(self, digest, image_size):
+        """
+        Returns the cached detections of a face as Instances of the given (height, width),
+        or None if the face has not been run with this config yet.
+        """
+        with self.lock:
+            entry = self.previous.get(digest) or self.current.get(digest)
+        if entry is None:
+            return None
+        self.add(digest, entry, hit=True)
+        return instances_from_entry(entry, image_size)
+
+    def put(self, digest, instances):
+        """Records the raw detections of a face that was run through the model."""
+        self.add(digest, entry_from_instances(instances))
+
+    def add(self, digest, entry, hit=False):
+        """Records a face's cache entry as used in this run; hit counts it as reused."""
+        with self.lock:
+            self.current[digest] = entry
+            self.hits += hit
+
+    def save(self):
+        """Writes the cache, replacing the old file atomically."""
+        with self.lock:
+            self.configs[self.config_key] = self.current
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({"models": self.models, "configs": self.configs}, f)
+            os.replace(temp_path, self.path)
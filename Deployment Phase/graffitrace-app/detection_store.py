@@ -0,0 +1,226 @@
+import os
+import csv
+import shutil
+import argparse
+import numpy as np
+import cv2
+import box_renderer
+import face_store
+
+# The model keeps every detection at or above this score, so any stricter threshold can
+# be applied afterwards without running the model again
+FLOOR_THRESHOLD = 0.05
+
+# Holds the detections of the last run, in the 'results' directory
+DETECTIONS_FILE_NAME = "detections.npz"
+
+# Records the threshold results.csv was last built for, in the 'results' directory
+THRESHOLD_FILE_NAME = "threshold.txt"
+
+# Columns of results.csv
+RESULTS_COLUMNS = ["graffiti_id", "source_file_name", "place", "latitude", "longitude", "num_graffiti_instances"]
+
+
+class DetectionTable:
+    """
+    Collects the detections of a run in columns: one row per face (name, latitude,
+    longitude) and one row per detection (face index, box, score, class). Saved as a
+    compressed NPZ that loads without pickle.
+    """
+
+    def __init__(self):
+        self.face_names = []
+        self.latitudes = []
+        self.longitudes = []
+        self.face_index = []
+        self.boxes = []
+        self.scores = []
+        self.classes = []
+
+    def add(self, image_name, latitude, longitude, boxes, scores, classes):
+        """Adds one face and its detections at or above FLOOR_THRESHOLD, in manifest order."""
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        keep = scores >= FLOOR_THRESHOLD
+        self.face_index.append(np.full(int(keep.sum()), len(self.face_names), dtype=np.int32))
+        self.boxes.append(np.asarray(boxes, dtype=np.float32).reshape(-1, 4)[keep])
+        self.scores.append(scores[keep])
+        self.classes.append(np.asarray(classes, dtype=np.int32).reshape(-1)[keep])
+        self.face_names.append(image_name)
+        self.latitudes.append(np.nan if latitude is None else float(latitude))
+        self.longitudes.append(np.nan if longitude is None else float(longitude))
+
+    def save(self, output_dir, target_place, renderer="opencv", render_scale=1.0):
+        """
+        Writes the table to output_dir/detections.npz, with the renderer and output scale
+        the run drew its result images with (see detect_images.RENDERERS), so images drawn
+        again later look the same.
+        """
+        np.savez_compressed(
+            os.path.join(output_dir, DETECTIONS_FILE_NAME),
+            face_names=np.array(self.face_names, dtype=str),
+            latitudes=np.array(self.latitudes, dtype=np.float64),
+            longitudes=np.array(self.longitudes, dtype=np.float64),
+            face_index=np.concatenate(self.face_index or [np.zeros(0, np.int32)]),
+            boxes=np.concatenate(self.boxes or [np.zeros((0, 4), np.float32)]),
+            scores=np.concatenate(self.scores or [np.zeros(0, np.float32)]),
+            classes=np.concatenate(self.classes or [np.zeros(0, np.int32)]),
+            place=np.array(target_place, dtype=str),
+            floor_threshold=np.array(FLOOR_THRESHOLD),
+            renderer=np.array(renderer, dtype=str),
+            render_scale=np.array(float(render_scale)),
+        )
+
+
+def write_threshold(output_dir, threshold):
+    """Records the threshold results.csv was built for."""
+    with open(os.path.join(output_dir, THRESHOLD_FILE_NAME), 'w') as f:
+        f.write(f"{threshold}\n")
+
+
+def read_threshold(output_dir, default=None):
+    """Returns the threshold results.csv was built for, or default if it is not recorded."""
+    try:
+        with open(os.path.join(output_dir, THRESHOLD_FILE_NAME)) as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return default
+
+
+def load_detections(output_dir):
+    """
+    Loads the detections of the last run.
+
+    Returns:
+        dict: The columns of the DetectionTable, as arrays.
+    """
+    with np.load(os.path.join(output_dir, DETECTIONS_FILE_NAME)) as data:
+        return {key: data[key] for key in data.files}
+
+
+def face_counts(detections, threshold):
+    """Returns the number of detections at or above the threshold of every face."""
+    if threshold < detections["floor_threshold"]:
+        raise ValueError(f"The detections were only kept down to {float(detections['floor_threshold'])}")
+    keep = detections["scores"] >= threshold
+    return np.bincount(detections["face_index"][keep], minlength=len(detections["face_names"]))
+
+
+def results_rows(detections, threshold):
+    """
+    Builds the results.csv rows for a threshold. Faces with at least one detection get
+    the IDs "Graffiti 00001", "Graffiti 00002", ... in manifest order, exactly like a
+    detection run at that threshold would assign them.
+
+    Returns:
+        list: (face_index, row) pairs, row holding the RESULTS_COLUMNS values.
+    """
+    counts = face_counts(detections, threshold)
+    place = str(detections["place"])
+    rows = []
+    for face_index in np.flatnonzero(counts):
+        rows.append((int(face_index), [
+            f"Graffiti {len(rows) + 1:05}", str(detections["face_names"][face_index]), place,
+            detections["latitudes"][face_index], detections["longitudes"][face_index], int(counts[face_index]),
+        ]))
+    return rows
+
+
+def render_face(project_directory, detections, face_index, threshold, result_image_path):
+    """
+    Draws the detections of one face at or above the threshold with the renderer and
+    scale of the run (box_renderer at scale 1 for detections saved without them) and
+    saves the image. The face is read back from 'Preprocessed'.
+
+    Returns:
+        bool: False if the face file is gone (e.g. a streaming run without kept faces).
+    """
+    image = face_store.load_face(
+        os.path.join(project_directory, "Preprocessed", str(detections["face_names"][face_index]))
+    )
+    if image is None:
+        return False
+    keep = (detections["face_index"] == face_index) & (detections["scores"] >= threshold)
+    renderer = str(detections["renderer"]) if "renderer" in detections else "opencv"
+    scale = float(detections["render_scale"]) if "render_scale" in detections else 1.0
+    if renderer == "opencv":
+        cv2.imwrite(result_image_path, box_renderer.draw_boxes(
+            image, detections["boxes"][keep], detections["scores"][keep], scale=scale
+        ))
+        return True
+
+    # The Visualizer needs detectron2, so it is only imported for runs that drew with it
+    from detectron2.data import MetadataCatalog
+    import detect_images
+    import detection_cache
+    instances = detection_cache.instances_from_entry({
+        "boxes": detections["boxes"][keep], "scores": detections["scores"][keep], "classes": detections["classes"][keep],
+    }, image.shape[:2])
+    detect_images.render_detections(
+        image, instances, MetadataCatalog.get("graffiti_train"), result_image_path, renderer, scale
+    )
+    return True
+
+
+def rebuild_results(project_directory, threshold, render=False):
+    """
+    Rewrites results.csv of the last run for another score threshold, from
+    results/detections.npz instead of running the model again.
+
+    The result images of the old threshold no longer match the new IDs and boxes, so they
+    are removed; with render, they are drawn again for the new threshold right away,
+    otherwise ReportFrame draws each one when it is first shown (see render_result_image).
+
+    Returns:
+        int: The number of faces with graffiti at the new threshold.
+    """
+    output_dir = os.path.join(project_directory, "results")
+    instance_dir = os.path.join(output_dir, "graffiti_instances")
+    detections = load_detections(output_dir)
+    rows = results_rows(detections, threshold)
+
+    temp_path = os.path.join(output_dir, "results.csv.tmp")
+    with open(temp_path, 'w', newline='') as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(RESULTS_COLUMNS)
+        csv_writer.writerows(row for _, row in rows)
+    os.replace(temp_path, os.path.join(output_dir, "results.csv"))
+    write_threshold(output_dir, threshold)
+
+    shutil.rmtree(instance_dir, ignore_errors=True)
+    os.makedirs(instance_dir)
+    if render:
+        for face_index, row in rows:
+            render_face(project_directory, detections, face_index, threshold, os.path.join(instance_dir, f"{row[0]}.jpg"))
+    print(f"Rebuilt results.csv at threshold {threshold}: {len(rows)} of {len(detections['face_names'])} faces with graffiti.")
+    return len(rows)
+
+
+def render_result_image(project_directory, graffiti_id):
+    """
+    Draws the result image of one results.csv row at the threshold results.csv was built
+    for, if it is not there yet, and returns its path (None if it cannot be drawn).
+    """
+    output_dir = os.path.join(project_directory, "results")
+    result_image_path = os.path.join(output_dir, "graffiti_instances", f"{graffiti_id}.jpg")
+    if os.path.exists(result_image_path):
+        return result_image_path
+    threshold = read_threshold(output_dir)
+    if threshold is None or not os.path.exists(os.path.join(output_dir, DETECTIONS_FILE_NAME)):
+        return None
+    detections = load_detections(output_dir)
+    for face_index, row in results_rows(detections, threshold):
+        if row[0] == graffiti_id:
+            if render_face(project_directory, detections, face_index, threshold, result_image_path):
+                return result_image_path
+            return None
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild results.csv of the last detection run for another threshold.")
+    parser.add_argument("project_directory", help="The project directory")
+    parser.add_argument("--threshold", type=float, required=True, help="The new score threshold")
+    parser.add_argument("--render", action="store_true", help="Draw all result images now instead of on demand")
+    args = parser.parse_args()
+
+    rebuild_results(args.project_directory, args.threshold, args.render)
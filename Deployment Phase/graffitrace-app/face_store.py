@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import cv2
+from PIL import Image
+
+# File extension of each supported face format
+FACE_FORMATS = {
+    "png": ".png",
+    "webp": ".webp",
+    "jpeg": ".jpg",
+    "npy": ".npy",
+}
+
+# Default encoder setting for each format:
+#   png  -> zlib compression level (0-9)
+#   webp -> lossless compression method (0 = fastest, 6 = smallest)
+#   jpeg -> quality (1-100)
+#   npy  -> unused, faces are stored as raw uint8 arrays
+DEFAULT_LEVELS = {
+    "png": 6,
+    "webp": 4,
+    "jpeg": 95,
+    "npy": None,
+}
+
+
+def face_file_name(stem, face_format="png"):
+    """Returns the file name of a face saved in the given format, e.g. '0001.png'."""
+    if face_format not in FACE_FORMATS:
+        raise ValueError(f"Unsupported face format: {face_format}. Choose from {', '.join(FACE_FORMATS)}")
+    return stem + FACE_FORMATS[face_format]
+
+
+def save_face(face_array, path, face_format="png", level=None):
+    """
+    Saves an RGB face in the given format.
+
+    Args:
+        face_array (np.ndarray): The (H, W[, C]) uint8 RGB face.
+        path (str): Destination path, with the extension of the format.
+        face_format (str): One of "png", "webp", "jpeg" or "npy".
+        level (int, optional): The encoder setting (see DEFAULT_LEVELS). Defaults to
+                               the format's default.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[face_format]
+
+    if face_format == "npy":
+        np.save(path, np.ascontiguousarray(face_array))
+    elif face_format == "png":
+        Image.fromarray(face_array).save(path, "PNG", compress_level=level)
+    elif face_format == "webp":
+        Image.fromarray(face_array).save(path, "WEBP", lossless=True, method=level)
+    elif face_format == "jpeg":
+        Image.fromarray(face_array).save(path, "JPEG", quality=level, subsampling=0)
+    else:
+        raise ValueError(f"Unsupported face format: {face_format}")
+
+
+def load_face(path):
+    """
+    Loads a face saved in any supported format, the way cv2.imread would.
+
+    .npy faces are memory-mapped instead of read into memory up front.
+
+    Args:
+        path (str): Path to the face file.
+
+    Returns:
+        np.ndarray: The (H, W, 3) uint8 BGR face, or None if it could not be read.
+    """
+    if os.path.splitext(path)[1].lower() != ".npy":
+        return cv2.imread(path)
+
+    try:
+        face = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return to_bgr(face)
+
+
+def to_bgr(face_array):
+    """Converts an RGB(A) or grayscale face to the contiguous BGR layout the detector expects."""
+    if face_array.ndim == 2:
+        return cv2.cvtColor(np.asarray(face_array), cv2.COLOR_GRAY2BGR)
+    return np.ascontiguousarray(face_array[:, :, 2::-1])
@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+import torch
+from torch import nn
+
+# Side of the square the gate sees a face at
+GATE_INPUT_SIZE = 224
+
+# Graffiti probability below which a face skips the detector, for gate files that do not
+# record a calibrated threshold (detectron2_model/train_gate.py records one)
+GATE_THRESHOLD = 0.05
+
+
+class GateNet(nn.Module):
+    """
+    A small CNN telling faces with graffiti from empty ones: four strided conv blocks,
+    global average pooling and one logit. Trained by detectron2_model/train_gate.py.
+    """
+
+    def __init__(self, width=16):
+        super().__init__()
+        layers = []
+        channels = 3
+        for out_channels in (width, width * 2, width * 4, width * 8):
+            layers += [
+                nn.Conv2d(channels, out_channels, 3, stride=2, padding=1, bias=False),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(inplace=True),
+                nn.Conv2d(out_channels, out_channels, 3, padding=1, bias=False),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(inplace=True),
+            ]
+            channels = out_channels
+        self.features = nn.Sequential(*layers)
+        self.classifier = nn.Linear(channels, 1)
+
+    def forward(self, x):
+        return self.classifier(self.features(x).mean(dim=(2, 3))).squeeze(1)
+
+
+def to_tensor(image, input_size=GATE_INPUT_SIZE):
+    """Turns one BGR face into the gate's (3, input_size, input_size) float input."""
+    if image.shape[:2] != (input_size, input_size):
+        image = cv2.resize(image, (input_size, input_size), interpolation=cv2.INTER_AREA)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+    return torch.from_numpy(image.transpose(2, 0, 1).copy())
+
+
+def save_gate(model, path, input_size=GATE_INPUT_SIZE, threshold=None, report=None):
+    """Writes the gate weights with the input size, the calibrated threshold and the calibration report."""
+    torch.save({
+        "state_dict": model.state_dict(),
+        "width": model.features[0].out_channels,
+        "input_size": input_size,
+        "threshold": threshold,
+        "report": report,
+    }, path)
+
+
+class GateClassifier:
+    """
+    Loads a gate file written by save_gate and tells whether a face is worth running the
+    detector on. Runs on the CPU; the gate is small enough that it costs a fraction of
+    the detector's time per face.
+    """
+
+    def __init__(self, gate_path, threshold=None):
+        checkpoint = torch.load(gate_path, map_location="cpu")
+        self.model = GateNet(checkpoint["width"])
+        self.model.load_state_dict(checkpoint["state_dict"])
+        self.model.eval()
+        self.input_size = checkpoint["input_size"]
+        if threshold is None:
+            threshold = checkpoint.get("threshold")
+        self.threshold = GATE_THRESHOLD if threshold is None else threshold
+
+    def probabilities(self, images):
+        """Returns the graffiti probability of each BGR face."""
+        batch = torch.stack([to_tensor(image, self.input_size) for image in images])
+        with torch.no_grad():
+            return torch.sigmoid(self.model(batch)).tolist()
+
+    def passes(self, image):
+        """True if the face may hold graffiti and should go through the detector."""
+        return self.probabilities([image])[0] >= self.threshold
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# There is no display on a server: keep matplotlib (the "visualizer" renderer) on a file backend
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import torch
+import pandas as pd
+import data_preprocessing
+import detect_images
+import face_store
+import streaming_pipeline
+from generate_pdf import generate_pdf_report
+
+# Written to every project directory: the output of its run, and its part of the run summary
+LOG_FILE_NAME = "pipeline.log"
+PROJECT_SUMMARY_FILE_NAME = "pipeline_summary.json"
+
+# Written to the current directory unless --summary says otherwise
+RUN_SUMMARY_FILE_NAME = "run_summary.json"
+
+
+def worker_share(workers, parallel_projects):
+    """The CPU workers each of the projects running at the same time gets from the budget."""
+    return max(1, workers // max(1, parallel_projects))
+
+
+def load_results(csv_path):
+    """Reads results.csv the way ReportFrame does before exporting, without the dialogs."""
+    graffiti_data = pd.read_csv(csv_path)
+    graffiti_data['latitude'] = pd.to_numeric(graffiti_data['latitude'], errors='coerce')
+    graffiti_data['longitude'] = pd.to_numeric(graffiti_data['longitude'], errors='coerce')
+    return graffiti_data.dropna(subset=['latitude', 'longitude'])
+
+
+def run_project(project_directory, model_path, target_place, workers, options):
+    """
+    Runs preprocessing, detection and the PDF export for one project in this process,
+    the same steps the App runs, with every step limited to the given number of workers
+    (preprocessing processes and torch threads).
+
+    Args:
+        project_directory (str): The project directory, holding 'images'.
+        model_path (str): The path to the model file.
+        target_place (str): The name of the place, written to results.csv.
+        workers (int): This project's share of the worker budget.
+        options (dict): The parsed command-line pipeline options (see the bottom of this file).
+
+    Returns:
+        dict: The seconds and summary of every step, and the number of results.csv rows.
+    """
+    # The library functions only print this, which would let the run count as a success
+    if not options["skip_preprocessing"] and not os.path.isdir(os.path.join(project_directory, "images")):
+        raise FileNotFoundError(f"'images' directory not found in {project_directory}")
+    torch.set_num_threads(workers)
+    detection_options = dict(
+        batch_size=options["batch_size"], renderer=options["renderer"], backend=options["backend"],
+        num_threads=workers, resolution=options["resolution"], use_cache=not options["no_cache"],
+        threshold=options["threshold"], gate_path=options["gate"], gate_threshold=options["gate_threshold"],
+        skip_duplicates=options["skip_duplicates"],
+    )
+    steps = {}
+
+    start = time.perf_counter()
+    if options["streaming"]:
+        detection = streaming_pipeline.run_streaming_pipeline(
+            project_directory, model_path, target_place, keep_faces=True, workers=workers,
+            face_format=options["face_format"], **detection_options
+        )
+        steps["preprocessing_and_detection"] = {"seconds": time.perf_counter() - start, "detection": detection}
+    else:
+        if options["skip_preprocessing"]:
+            print("Skipping preprocessing, detecting the faces already in 'Preprocessed'.")
+        else:
+            preprocessing = data_preprocessing.run_data_preprocessing(
+                project_directory, workers=workers, face_format=options["face_format"],
+                resolution=options["resolution"]
+            )
+            steps["preprocessing"] = {"seconds": time.perf_counter() - start, "summary": preprocessing}
+            start = time.perf_counter()
+        detection = detect_images.run_graffiti_detection(project_directory, model_path, target_place, **detection_options)
+        steps["detection"] = {"seconds": time.perf_counter() - start, "summary": detection}
+
+    csv_path = os.path.join(project_directory, "results", "results.csv")
+    graffiti_data = load_results(csv_path)
+    if not options["no_pdf"]:
+        start = time.perf_counter()
+        pdf_path = os.path.join(project_directory, "results", "report.pdf")
+        generate_pdf_report(pdf_path, project_directory, graffiti_data)
+        steps["pdf"] = {"seconds": time.perf_counter() - start, "path": pdf_path}
+    return {"steps": steps, "results": len(graffiti_data), "results_csv": csv_path}
+
+
+def run_project_process(job):
+    """
+    The entry point of a project's own process (see run_projects): runs the project and
+    writes its summary to the project directory, also when it fails.
+    """
+    summary = {
+        "project": job["project"], "place": job["place"], "workers": job["workers"],
+        "started": datetime.now().isoformat(timespec="seconds"),
+    }
+    start = time.perf_counter()
+    try:
+        summary.update(run_project(job["project"], job["model"], job["place"], job["workers"], job["options"]))
+        summary["status"] = "succeeded"
+    except Exception as e:
+        traceback.print_exc()
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = time.perf_counter() - start
+    with open(os.path.join(job["project"], PROJECT_SUMMARY_FILE_NAME), 'w') as f:
+        json.dump(summary, f, indent=4, default=str)
+    return summary["status"] == "succeeded"
+
+
+def run_in_subprocess(job):
+    """
+    Runs one project in a fresh Python process, its output going to the project's log
+    file, and returns its summary. A crash of the process is recorded as a failure too.
+    """
+    summary_path = os.path.join(job["project"], PROJECT_SUMMARY_FILE_NAME)
+    log_path = os.path.join(job["project"], LOG_FILE_NAME)
+    if os.path.exists(summary_path):
+        os.remove(summary_path)
+    env = dict(os.environ, OMP_NUM_THREADS=str(job["workers"]), MKL_NUM_THREADS=str(job["workers"]),
+               PYTHONUNBUFFERED="1")
+    print(f"Started {job['project']} with {job['workers']} workers (log: {log_path})")
+    with open(log_path, 'w') as log:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-project", json.dumps(job)],
+            stdout=log, stderr=subprocess.STDOUT, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    try:
+        with open(summary_path) as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        summary = {"project": job["project"], "place": job["place"], "workers": job["workers"], "status": "failed",
+                   "error": f"The project process exited with code {process.returncode} without a summary"}
+    summary["returncode"] = process.returncode
+    summary["log"] = log_path
+    print(f"Finished {job['project']}: {summary['status']}")
+    return summary
+
+
+def run_projects(projects, model_path, places, workers, parallel_projects, options):
+    """
+    Runs the pipeline for several projects, parallel_projects at a time, each in its own
+    process with an equal share of the worker budget. A failing project does not stop
+    the others.
+
+    Args:
+        projects (list): The project directories.
+        model_path (str): The path to the model file.
+        places (list): The target place of each project.
+        workers (int): The total worker budget.
+        parallel_projects (int): The number of projects running at the same time.
+        options (dict): The pipeline options, see run_project.
+
+    Returns:
+        dict: The run summary, with the summary of every project in the given order.
+    """
+    share = worker_share(workers, parallel_projects)
+    jobs = [
+        {"project": os.path.abspath(project), "model": os.path.abspath(model_path), "place": place,
+         "workers": share, "options": options}
+        for project, place in zip(projects, places)
+    ]
+    started = datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max(1, parallel_projects)) as pool:
+        project_summaries = list(pool.map(run_in_subprocess, jobs))
+    return {
+        "started": started,
+        "seconds": time.perf_counter() - start,
+        "model": os.path.abspath(model_path),
+        "workers": workers,
+        "parallel_projects": parallel_projects,
+        "workers_per_project": share,
+        "options": options,
+        "succeeded": sum(summary["status"] == "succeeded" for summary in project_summaries),
+        "failed": sum(summary["status"] != "succeeded" for summary in project_summaries),
+        "projects": project_summaries,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run preprocessing, detection and the PDF export for project directories, without the GUI."
+    )
+    parser.add_argument("projects", nargs="*", help="Project directories, each holding an 'images' directory")
+    parser.add_argument("--model", help="Path to the model weights")
+    parser.add_argument("--place", action="append",
+                        help="Target place written to results.csv; once for all projects or once per project "
+                             "(default: the project directory's name)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Total worker budget (CPU processes/threads) shared by the running projects")
+    parser.add_argument("--parallel-projects", type=int, default=1, help="Number of projects run at the same time")
+    parser.add_argument("--summary", default=RUN_SUMMARY_FILE_NAME, help="Where to write the JSON run summary")
+    parser.add_argument("--batch-size", type=int, default=detect_images.DEFAULT_BATCH_SIZE, help="Faces per forward pass")
+    parser.add_argument("--backend", default="eager", choices=detect_images.BACKENDS, help="Inference backend")
+    parser.add_argument("--resolution", type=int, help="Face width and detector input size, see resolution_policy.py")
+    parser.add_argument("--threshold", type=float, default=detect_images.DETECTION_THRESHOLD,
+                        help="Score a detection needs to count in results.csv")
+    parser.add_argument("--renderer", default="visualizer", choices=list(detect_images.RENDERERS), help="Result image renderer")
+    parser.add_argument("--face-format", default="png", choices=list(face_store.FACE_FORMATS), help="Face file format")
+    parser.add_argument("--streaming", action="store_true", help="Feed the faces straight into detection, see streaming_pipeline.py")
+    parser.add_argument("--skip-preprocessing", action="store_true", help="Detect the faces already in 'Preprocessed'")
+    parser.add_argument("--no-cache", action="store_true", help="Run every face through the model again")
+    parser.add_argument("--gate", help="Gate classifier whose rejected faces skip the detector, see gate_classifier.py")
+    parser.add_argument("--gate-threshold", type=float, help="Gate threshold instead of the calibrated one")
+    parser.add_argument("--skip-duplicates", action="store_true", help="Reuse detections of near-duplicate faces")
+    parser.add_argument("--no-pdf", action="store_true", help="Do not export report.pdf")
+    parser.add_argument("--run-project", help=argparse.SUPPRESS)  # Internal: one project's process, see run_in_subprocess
+    args = parser.parse_args()
+
+    if args.run_project:
+        sys.exit(0 if run_project_process(json.loads(args.run_project)) else 1)
+
+    if not args.projects or not args.model:
+        parser.error("project directories and --model are required")
+    if args.streaming and args.skip_preprocessing:
+        parser.error("--streaming preprocesses the images itself; drop --skip-preprocessing")
+    missing = [project for project in args.projects if not os.path.isdir(project)]
+    if missing:
+        parser.error(f"not a directory: {', '.join(missing)}")
+    if not os.path.exists(args.model):
+        parser.error(f"model not found: {args.model}")
+    if args.place and len(args.place) not in (1, len(args.projects)):
+        parser.error("give --place once for all projects or once per project")
+    places = [
+        (args.place[0] if len(args.place) == 1 else args.place[i]) if args.place
+        else os.path.basename(os.path.normpath(project))
+        for i, project in enumerate(args.projects)
+    ]
+
+    options = {
+        key: getattr(args, key) for key in (
+            "batch_size", "backend", "resolution", "threshold", "renderer", "face_format", "streaming",
+            "skip_preprocessing", "no_cache", "skip_duplicates", "no_pdf", "gate_threshold",
+        )
+    }
+    options["gate"] = os.path.abspath(args.gate) if args.gate else None
+
+    run_summary = run_projects(args.projects, args.model, places, args.workers, args.parallel_projects, options)
+    with open(args.summary, 'w') as f:
+        json.dump(run_summary, f, indent=4, default=str)
+    print(f"\n{run_summary['succeeded']} of {len(args.projects)} projects succeeded in {run_summary['seconds']:.0f} s; "
+          f"summary written to {args.summary}")
+    sys.exit(0 if run_summary["failed"] == 0 else 1)
@@ -0,0 +1,207 @@
+import struct
+import numpy as np
+from PIL import Image
+import cubemap_sampler
+
+# JPEG markers
+_SOI = 0xD8
+_EOI = 0xD9
+_SOS = 0xDA
+_APP1 = 0xE1
+
+# EXIF tags
+_GPS_IFD_POINTER = 0x8825
+_GPS_LATITUDE_REF = 1
+_GPS_LATITUDE = 2
+_GPS_LONGITUDE_REF = 3
+_GPS_LONGITUDE = 4
+
+# EXIF field types
+_ASCII = 2
+_RATIONAL = 5
+_SRATIONAL = 10
+
+
+def _read_exif_segment(image_path):
+    """
+    Walks the JPEG marker segments up to the start of the scan and returns the
+    TIFF payload of the EXIF APP1 segment, without touching the pixel data.
+
+    Args:
+        image_path (str): Path to the JPEG file.
+
+    Returns:
+        bytes: The TIFF structure of the EXIF segment, or None if there is none.
+    """
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b"\xff" + bytes([_SOI]):
+            return None
+        while True:
+            byte = f.read(1)
+            if not byte:
+                return None
+            if byte != b"\xff":
+                continue
+            marker = f.read(1)
+            while marker == b"\xff":  # Skip fill bytes
+                marker = f.read(1)
+            if not marker or marker[0] in (_SOS, _EOI):
+                return None
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = struct.unpack(">H", length_bytes)[0]
+            if marker[0] == _APP1:
+                segment = f.read(length - 2)
+                if segment.startswith(b"Exif\x00\x00"):
+                    return segment[6:]
+            else:
+                f.seek(length - 2, 1)
+
+
+def _read_ifd(tiff, offset, endian):
+    """
+    Reads the entries of a single TIFF IFD.
+
+    Returns:
+        dict: Maps each tag to its (type, count, value_or_offset_bytes) triple.
+    """
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    entries = {}
+    for i in range(count):
+        start = offset + 2 + i * 12
+        tag, field_type, value_count = struct.unpack(endian + "HHI", tiff[start:start + 8])
+        entries[tag] = (field_type, value_count, tiff[start + 8:start + 12])
+    return entries
+
+
+def _read_ascii(tiff, entry, endian):
+    field_type, count, raw = entry
+    if field_type != _ASCII:
+        return None
+    if count > 4:
+        raw = tiff[struct.unpack(endian + "I", raw)[0]:][:count]
+    return raw[:count].split(b"\x00")[0].decode("ascii", errors="ignore")
+
+
+def _read_degrees(tiff, entry, endian):
+    """Converts a degree/minute/second rational triple to decimal degrees."""
+    field_type, count, raw = entry
+    if field_type not in (_RATIONAL, _SRATIONAL) or count < 3:
+        return None
+    fmt = endian + ("6I" if field_type == _RATIONAL else "6i")
+    offset = struct.unpack(endian + "I", raw)[0]
+    values = struct.unpack(fmt, tiff[offset:offset + 24])
+    parts = []
+    for numerator, denominator in zip(values[0::2], values[1::2]):
+        if denominator == 0:
+            return None
+        parts.append(numerator / denominator)
+    d, m, s = parts
+    return d + m / 60.0 + s / 3600.0
+
+
+def read_gps_coordinates(image_path):
+    """
+    Extracts the latitude and longitude from the EXIF GPS tags of a JPEG,
+    reading only the APP1 header segment (no pixel decoding).
+
+    Args:
+        image_path (str): Path to the JPEG file.
+
+    Returns:
+        tuple: (latitude, longitude) in decimal degrees, or (None, None) if the image
+               has no usable GPS data.
+    """
+    tiff = _read_exif_segment(image_path)
+    if not tiff or len(tiff) < 8:
+        return None, None
+
+    try:
+        endian = "<" if tiff[:2] == b"II" else ">"
+        ifd0 = _read_ifd(tiff, struct.unpack(endian + "I", tiff[4:8])[0], endian)
+        if _GPS_IFD_POINTER not in ifd0:
+            return None, None
+        gps_offset = struct.unpack(endian + "I", ifd0[_GPS_IFD_POINTER][2])[0]
+        gps = _read_ifd(tiff, gps_offset, endian)
+
+        if not all(tag in gps for tag in (_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE)):
+            return None, None
+        latitude = _read_degrees(tiff, gps[_GPS_LATITUDE], endian)
+        longitude = _read_degrees(tiff, gps[_GPS_LONGITUDE], endian)
+        if latitude is None or longitude is None:
+            return None, None
+        if _read_ascii(tiff, gps[_GPS_LATITUDE_REF], endian) == 'S':
+            latitude = -latitude
+        if _read_ascii(tiff, gps[_GPS_LONGITUDE_REF], endian) == 'W':
+            longitude = -longitude
+        return latitude, longitude
+    except struct.error:
+        # Truncated or malformed EXIF block
+        return None, None
+
+
+def _open_drafted(image_path, face_w):
+    """Opens an image and configures JPEG reduced-size decoding for faces of width face_w."""
+    img = Image.open(image_path)
+    img.draft(img.mode, (4 * face_w, 2 * face_w))
+    return img
+
+
+def decoded_size(image_path, face_w):
+    """
+    Returns the size load_equirectangular will decode an image at, from its header only.
+
+    Args:
+        image_path (str): Path to the image file.
+        face_w (int): The width of the cube faces that will be projected from it.
+
+    Returns:
+        tuple: (width, height, bands) of the decoded image.
+    """
+    with _open_drafted(image_path, face_w) as img:
+        return img.size[0], img.size[1], len(img.getbands())
+
+
+def load_equirectangular(image_path, face_w):
+    """
+    Decodes an equirectangular panorama once, at the smallest JPEG reduced-size scale
+    (1/2, 1/4 or 1/8) that still leaves enough resolution for faces of width face_w.
+
+    A cube face covers 90 degrees of longitude, so a panorama at least 4 * face_w
+    pixels wide samples every face at (or above) its native resolution.
+
+    Args:
+        image_path (str): Path to the image file.
+        face_w (int): The width of the cube faces that will be projected from it.
+
+    Returns:
+        np.ndarray: The decoded (H, W[, C]) uint8 image.
+    """
+    with _open_drafted(image_path, face_w) as img:
+        return np.asarray(img)
+
+
+def load_equirectangular_band(image_path, face_w, faces):
+    """
+    Like load_equirectangular, but only keeps the band of rows the given cube faces
+    sample from (see cubemap_sampler.source_rows). The full decode is released as soon
+    as the band has been cut out of it, so only the band is held while the faces are
+    projected and saved. (Baseline JPEGs are still decoded top to bottom; Pillow cannot
+    skip the rows outside the band.)
+
+    Args:
+        image_path (str): Path to the image file.
+        face_w (int): The width of the cube faces that will be projected from it.
+        faces (tuple): The names of those faces.
+
+    Returns:
+        tuple: (band, full_height, top): the (H, W[, C]) uint8 band, the height of the
+               full decoded panorama and the panorama row the band starts at.
+    """
+    with _open_drafted(image_path, face_w) as img:
+        width, full_height = img.size
+        top, bottom = cubemap_sampler.source_rows(full_height, width, face_w, tuple(faces))
+        band_image = img.crop((0, top, width, bottom))
+    with band_image:
+        return np.asarray(band_image), full_height, top
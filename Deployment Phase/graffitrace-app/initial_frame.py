@@ -2,8 +2,9 @@ import tkinter
 import customtkinter
 from tkinter import filedialog
 import os
-from PIL import Image, ExifTags, ImageTk  # Import PIL for image processing
+from PIL import Image, ImageTk  # Import PIL for image processing
 import threading  # Import the threading module
+import image_loader
 
 class InitialFrame(customtkinter.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -218,6 +219,7 @@ class InitialFrame(customtkinter.CTkFrame):
         """
         try:
             img = Image.open(image_path)
+            img.draft(img.mode, (size, size))  # Decode JPEGs at a reduced scale
             # Crop the image to a square
             width, height = img.size
             if width > height:
@@ -246,51 +248,12 @@ class InitialFrame(customtkinter.CTkFrame):
             tuple: A tuple containing (latitude, longitude).  Returns (None, None) if no EXIF data or location is found.
         """
         try:
-            img = Image.open(image_path)
-            if hasattr(img, '_getexif') and img._getexif() is not None:
-                exif_data = img._getexif()
-                #print(f"EXIF Data for {image_path}: {exif_data}")  # Print the entire EXIF data
-                for tag_id, tag_value in exif_data.items():
-                    tag_name = ExifTags.TAGS.get(tag_id, tag_value)
-                    #print(f"Tag Name: {tag_name}, Tag Value: {tag_value}")
-                    if tag_name == 'GPSInfo':
-                        #print(f"GPSInfo Tag Value: {tag_value}")
-                        latitude, longitude = self.get_coordinates(gps_info=tag_value)
-                        return latitude, longitude
-            return None, None
+            # Only the JPEG header is read, the panorama itself is not decoded
+            return image_loader.read_gps_coordinates(image_path)
         except Exception as e:
             print(f"Error reading EXIF data from {image_path}: {e}")
             return None, None
 
-    def get_coordinates(self, gps_info):
-        """
-        Helper function to extract latitude and longitude from GPSInfo.
-        """
-
-        def _convert_to_degrees(value):
-            print(f"Value in _convert_to_degrees: {value}, type: {type(value)}")
-            if isinstance(value, tuple):
-                d = float(value[0])
-                m = float(value[1]) / 60.0
-                s = float(value[2]) / 3600.0
-                return d + m + s
-            elif hasattr(value, '__float__'):
-                return float(value)
-            else:
-                return value
-
-        latitude = None
-        longitude = None
-        #print(f"GPS Info in get_coordinates: {gps_info}, type: {type(gps_info)}")
-        if 1 in gps_info and 2 in gps_info and 3 in gps_info and 4 in gps_info:
-            latitude = _convert_to_degrees(gps_info[2])
-            longitude = _convert_to_degrees(gps_info[4])
-            if gps_info[1] == 'S':
-                latitude = -latitude
-            if gps_info[3] == 'W':
-                longitude = -longitude
-        return latitude, longitude
-
     def select_project_directory(self):
         """
         Opens a directory selection dialog and sets the selected path to the project_dir_entry.
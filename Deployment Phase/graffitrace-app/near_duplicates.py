@@ -0,0 +1,163 @@
+import math
+from collections import deque
+import cv2
+import numpy as np
+from box_utils import box_iou
+
+# Largest Hamming distance between two 64-bit perceptual hashes still taken as the same view
+HAMMING_THRESHOLD = 6
+
+# Largest distance between the capture points of two faces taken as the same view, in meters
+MAX_METERS = 10.0
+
+# Number of recently inferred faces a face is compared against (a few panoramas' worth)
+WINDOW = 36
+
+# Every VERIFY_EVERY-th near-duplicate is run through the model anyway, to check the reuse
+VERIFY_EVERY = 20
+
+
+def phash(image):
+    """
+    Returns the 64-bit perceptual hash of a BGR face: the signs of the 8x8 lowest
+    frequencies of the 32x32 grayscale DCT, against their median.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    gray = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(gray)[:8, :8].reshape(-1)
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming(a, b):
+    """The number of bits two hashes differ in."""
+    return bin(a ^ b).count("1")
+
+
+def gps_meters(lat1, lon1, lat2, lon2):
+    """The great-circle distance between two coordinates, in meters."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(a))
+
+
+def has_position(latitude, longitude):
+    """True if both coordinates are known."""
+    try:
+        return not (math.isnan(float(latitude)) or math.isnan(float(longitude)))
+    except (TypeError, ValueError):
+        return False
+
+
+def entries_agree(reused, inferred, threshold, min_iou=0.5):
+    """
+    True if two cache entries (see detection_cache.entry_from_instances) hold the same
+    detections at the threshold: as many boxes, each pairing with one of the other's at
+    IoU >= min_iou.
+    """
+    boxes_a = [box for box, score in zip(reused["boxes"], reused["scores"]) if score >= threshold]
+    boxes_b = [box for box, score in zip(inferred["boxes"], inferred["scores"]) if score >= threshold]
+    if len(boxes_a) != len(boxes_b):
+        return False
+    for box in boxes_a:
+        ious = [box_iou(box, other) for other in boxes_b]
+        best = int(np.argmax(ious)) if ious else None
+        if best is None or ious[best] < min_iou:
+            return False
+        boxes_b.pop(best)
+    return True
+
+
+class NearDuplicateIndex:
+    """
+    The perceptual hashes and capture points of the last WINDOW faces sent to the model.
+    A face within HAMMING_THRESHOLD bits and MAX_METERS of one of them (e.g. the same view
+    from a stopped capture vehicle) reuses its detections instead of being run itself.
+
+    Faces are matched as they arrive, before they are batched, so a face can match one
+    that is still waiting in the same batch: register returns a record whose detections
+    are filled in with complete once the model has run the face, which always happens
+    before any later face is handed on (detection assigns results in arrival order).
+
+    Every VERIFY_EVERY-th match, starting with the first, is flagged for verification:
+    the face is run through the model anyway and the outcome is recorded with
+    record_verification, so the reuse can be checked on every run.
+    """
+
+    def __init__(self, hamming_threshold=HAMMING_THRESHOLD, max_meters=MAX_METERS, window=WINDOW,
+                 verify_every=VERIFY_EVERY):
+        self.hamming_threshold = hamming_threshold
+        self.max_meters = max_meters
+        self.recent = deque(maxlen=window)
+        self.verify_every = verify_every
+        self.matches = 0
+        self.reused = 0
+        self.verifications = []
+
+    def register(self, face_hash, latitude, longitude, image_name):
+        """
+        Records a face that is sent to the model.
+
+        Returns:
+            dict: The face's record, or None if it has no position to be matched by.
+        """
+        if face_hash is None or not has_position(latitude, longitude):
+            return None
+        record = {"hash": face_hash, "latitude": float(latitude), "longitude": float(longitude),
+                  "image_name": image_name, "entry": None}
+        self.recent.append(record)
+        return record
+
+    @staticmethod
+    def complete(record, entry):
+        """Fills in the detections (a detection_cache entry) of a registered face."""
+        record["entry"] = entry
+
+    def find(self, face_hash, latitude, longitude):
+        """
+        Looks for the closest registered face in hash distance that is close enough in
+        both hash and position.
+
+        Returns:
+            dict: The match (image_name, source record, hamming, meters, verify) or None;
+                  with verify, the caller runs the face anyway and records the outcome.
+        """
+        if face_hash is None or not has_position(latitude, longitude):
+            return None
+        best = None
+        for record in reversed(self.recent):
+            distance = hamming(face_hash, record["hash"])
+            if distance > self.hamming_threshold or (best and distance >= best["hamming"]):
+                continue
+            meters = gps_meters(float(latitude), float(longitude), record["latitude"], record["longitude"])
+            if meters <= self.max_meters:
+                best = {"image_name": record["image_name"], "source": record, "hamming": distance, "meters": meters}
+        if best is None:
+            return None
+        best["verify"] = self.matches % self.verify_every == 0
+        self.matches += 1
+        self.reused += not best["verify"]
+        return best
+
+    def record_verification(self, image_name, match, entry, threshold):
+        """Records whether the model's detections of a verified face agree with the reused ones."""
+        reused = match["source"]["entry"]
+        self.verifications.append({
+            "face": image_name,
+            "duplicate_of": match["image_name"],
+            "hamming": match["hamming"],
+            "meters": round(match["meters"], 2),
+            "reused_detections": sum(score >= threshold for score in reused["scores"]),
+            "model_detections": sum(score >= threshold for score in entry["scores"]),
+            "agree": entries_agree(reused, entry, threshold),
+        })
+
+    def summary(self, faces):
+        """The skip rate over a run of faces and the outcome of the verification sample."""
+        return {
+            "duplicate_faces": self.reused,
+            "skip_rate": self.reused / faces if faces else 0.0,
+            "verified": len(self.verifications),
+            "verified_agreeing": sum(v["agree"] for v in self.verifications),
+            "verification_sample": self.verifications,
+        }
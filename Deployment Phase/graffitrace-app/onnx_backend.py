@@ -0,0 +1,154 @@
+import os
+import argparse
+import numpy as np
+import torch
+import onnxruntime
+import detectron2.data.transforms as T
+from detectron2.modeling import build_model
+from detectron2.checkpoint import DetectionCheckpointer
+from detectron2.structures import Boxes, Instances
+import detect_images
+import quantization
+import resolution_policy
+
+# Names of the graph inputs and outputs, shared by the exporter and the predictor
+INPUT_NAME = "image"
+OUTPUT_NAMES = ("boxes", "scores", "classes")
+
+
+def _resize_transform(cfg):
+    """The test-time resize the detectron2 predictors apply before the model."""
+    return T.ResizeShortestEdge([cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST)
+
+
+def _preprocess(aug, input_format, original_image):
+    """Resizes one (H, W, C) BGR image into the (3, h, w) float32 array the graph takes."""
+    if input_format == "RGB":
+        original_image = original_image[:, :, ::-1]
+    image = aug.get_transform(original_image).apply_image(original_image)
+    return np.ascontiguousarray(image.astype("float32").transpose(2, 0, 1))
+
+
+class _ExportWrapper(torch.nn.Module):
+    """
+    Exposes GeneralizedRCNN as image tensor -> (boxes, scores, classes). Boxes are left
+    in the coordinates of the resized input; OnnxPredictor scales them back.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image):
+        instances = self.model.inference([{"image": image}], do_postprocess=False)[0]
+        return instances.pred_boxes.tensor, instances.scores, instances.pred_classes
+
+
+def export_onnx(model_path, output_path, resolution=None, sample_image=None, opset=16):
+    """
+    Exports a trained detectron2 graffiti model to ONNX.
+
+    The graph is traced for the faces of a resolution setting (see resolution_policy.py),
+    after the same test-time resize as detect_images, so it takes exactly the inputs the
+    app feeds it. Re-export after changing the resolution.
+
+    Args:
+        model_path (str): The trained float model (.pth).
+        output_path (str): Where to write the .onnx file.
+        resolution (int, optional): The resolution setting the graph is traced for.
+        sample_image (np.ndarray, optional): A BGR face of that resolution to trace with.
+                                             Defaults to random noise.
+        opset (int): The ONNX opset (16 is the first with half-pixel RoiAlign).
+    """
+    if quantization.read_quantization_info(model_path) is not None:
+        raise ValueError("Export the float model; int8 models cannot be exported to ONNX")
+
+    cfg = detect_images.setup_cfg(model_path, resolution)
+    cfg.MODEL.DEVICE = "cpu"
+    face_w = resolution_policy.face_width(resolution)
+    model = build_model(cfg)
+    DetectionCheckpointer(model).load(model_path)
+    model.eval()
+
+    if sample_image is None:
+        sample_image = np.random.default_rng(0).integers(0, 256, (face_w, face_w, 3), dtype=np.uint8)
+    image = torch.from_numpy(_preprocess(_resize_transform(cfg), cfg.INPUT.FORMAT, sample_image))
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _ExportWrapper(model), (image,), output_path,
+            opset_version=opset,
+            input_names=[INPUT_NAME],
+            output_names=list(OUTPUT_NAMES),
+            dynamic_axes={name: {0: "detections"} for name in OUTPUT_NAMES},
+        )
+    print(f"Exported {model_path} to {output_path} (input 3x{image.shape[1]}x{image.shape[2]})")
+
+
+class OnnxPredictor:
+    """
+    Runs an exported graffiti model with ONNX Runtime on the CPU, with the same
+    preprocess/predict interface and {"instances": Instances} outputs as
+    detect_images.BatchPredictor.
+    """
+
+    def __init__(self, cfg, num_threads=None):
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+        self.session = onnxruntime.InferenceSession(
+            cfg.MODEL.WEIGHTS, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_shape = tuple(self.session.get_inputs()[0].shape)
+        self.aug = _resize_transform(cfg)
+        self.input_format = cfg.INPUT.FORMAT
+
+    def preprocess(self, original_image):
+        """Resizes one (H, W, C) BGR image into a model input dict."""
+        height, width = original_image.shape[:2]
+        image = _preprocess(self.aug, self.input_format, original_image)
+        if image.shape != self.input_shape:
+            raise ValueError(
+                f"The ONNX model was exported for {self.input_shape[1]}x{self.input_shape[2]} inputs, got "
+                f"{image.shape[1]}x{image.shape[2]}; re-export it for the current resolution"
+            )
+        return {"image": image, "height": height, "width": width}
+
+    def predict(self, inputs):
+        """Runs the inputs one after the other; ONNX Runtime parallelises inside each one."""
+        outputs = []
+        for input_dict in inputs:
+            boxes, scores, classes = self.session.run(list(OUTPUT_NAMES), {INPUT_NAME: input_dict["image"]})
+            outputs.append({"instances": self._postprocess(boxes, scores, classes, input_dict)})
+        return outputs
+
+    def __call__(self, original_images):
+        return self.predict([self.preprocess(image) for image in original_images])
+
+    @staticmethod
+    def _postprocess(boxes, scores, classes, input_dict):
+        """Scales the boxes back to the original image and drops empty ones, like detector_postprocess."""
+        height, width = input_dict["height"], input_dict["width"]
+        _, input_height, input_width = input_dict["image"].shape
+        boxes = boxes * np.array([width / input_width, height / input_height] * 2, dtype=np.float32)
+        boxes[:, 0::2] = boxes[:, 0::2].clip(0, width)
+        boxes[:, 1::2] = boxes[:, 1::2].clip(0, height)
+        keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+        instances = Instances((height, width))
+        instances.pred_boxes = Boxes(torch.from_numpy(boxes[keep]))
+        instances.scores = torch.from_numpy(scores[keep])
+        instances.pred_classes = torch.from_numpy(classes[keep])
+        return instances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained graffiti model to ONNX for the onnx backend.")
+    parser.add_argument("--model", required=True, help="Trained float model (.pth)")
+    parser.add_argument("--output", help="Where to write the ONNX model (default: <model>.onnx)")
+    parser.add_argument("--resolution", type=int,
+                        help="Resolution setting the app runs with (default: none, see resolution_policy.py)")
+    parser.add_argument("--opset", type=int, default=16, help="ONNX opset version")
+    args = parser.parse_args()
+
+    export_onnx(args.model, args.output or os.path.splitext(args.model)[0] + ".onnx", args.resolution, opset=args.opset)
@@ -0,0 +1,76 @@
+import torch
+from detectron2.checkpoint import DetectionCheckpointer
+
+# Key that marks checkpoints written by save_quantized_model
+QUANTIZATION_KEY = "quantization"
+
+# The Linear layers of the R101-FPN detector, most expensive first. fc1 alone multiplies
+# every proposal's 256x7x7 pooled features by a 12544x1024 matrix.
+BOX_HEAD_LINEAR_LAYERS = (
+    "roi_heads.box_head.fc1",
+    "roi_heads.box_head.fc2",
+    "roi_heads.box_predictor.cls_score",
+    "roi_heads.box_predictor.bbox_pred",
+)
+
+
+def quantize_linear_layers(model, layer_names):
+    """
+    Replaces the named Linear layers by dynamically quantized int8 ones (int8 weights,
+    activations quantized on the fly per batch). The model must be on the CPU.
+
+    Args:
+        model (torch.nn.Module): The float model, modified in place.
+        layer_names (list): Names of the Linear submodules, e.g. BOX_HEAD_LINEAR_LAYERS.
+
+    Returns:
+        torch.nn.Module: The model.
+    """
+    modules = dict(model.named_modules())
+    for name in layer_names:
+        if not isinstance(modules.get(name), torch.nn.Linear):
+            raise ValueError(f"Not a Linear layer of the model: {name}")
+    return torch.ao.quantization.quantize_dynamic(model, set(layer_names), dtype=torch.qint8, inplace=True)
+
+
+def save_quantized_model(model, path, layer_names, report=None):
+    """
+    Saves a model quantized with quantize_linear_layers, together with the names of the
+    quantized layers (so load_weights can rebuild the same structure) and an optional
+    report, e.g. the accuracy it was accepted with.
+    """
+    torch.save({
+        "model": model.state_dict(),
+        QUANTIZATION_KEY: {"method": "dynamic-int8", "layers": list(layer_names), "report": report or {}},
+    }, path)
+
+
+def read_quantization_info(path):
+    """
+    Returns the quantization record of a checkpoint written by save_quantized_model,
+    or None for any other (float) checkpoint. The weights are memory-mapped, not read.
+    """
+    try:
+        checkpoint = torch.load(path, map_location="cpu", mmap=True)
+    except Exception:
+        return None  # Not a zip-format torch checkpoint, e.g. a model zoo .pkl
+    return checkpoint.get(QUANTIZATION_KEY) if isinstance(checkpoint, dict) else None
+
+
+def load_weights(model, path):
+    """
+    Loads a checkpoint into a freshly built model: float checkpoints through detectron2's
+    checkpointer as usual, quantized ones by quantizing the same layers first.
+
+    Returns:
+        dict: The quantization record, or None for a float checkpoint.
+    """
+    info = read_quantization_info(path)
+    if info is None:
+        DetectionCheckpointer(model).load(path)
+        return None
+
+    model.to("cpu")
+    quantize_linear_layers(model, info["layers"])
+    model.load_state_dict(torch.load(path, map_location="cpu")["model"])
+    return info
@@ -16,10 +16,14 @@ import random
 import warnings  # Import warnings
 
 from generate_pdf import generate_pdf_report
+import detection_store
 
 # Suppress Warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# Score thresholds the results can be rebuilt for (see detection_store.rebuild_results)
+THRESHOLD_CHOICES = ["0.55", "0.6", "0.7", "0.8", "0.9"]
+
 
 class ReportFrame(customtkinter.CTkFrame):
     def __init__(self, master, project_directory, **kwargs):  # Added project_directory to init
@@ -98,6 +102,16 @@ class ReportFrame(customtkinter.CTkFrame):
                                                    command=self.on_export_button_click)
         self.export_button.pack(fill="both", expand=False, pady=(10, 18), padx=15)
 
+        # Score threshold of the results; changing it rebuilds results.csv from the stored detections
+        results_directory = os.path.join(self.project_directory, "results")
+        threshold = detection_store.read_threshold(results_directory, 0.55)
+        self.threshold_menu = customtkinter.CTkOptionMenu(self.right_frame, values=THRESHOLD_CHOICES, width=50,
+                                                          command=self.on_threshold_change)
+        self.threshold_menu.set(f"{threshold:g}")
+        if not os.path.exists(os.path.join(results_directory, detection_store.DETECTIONS_FILE_NAME)):
+            self.threshold_menu.configure(state="disabled")  # Results of a run without stored detections
+        self.threshold_menu.pack(fill="both", expand=False, pady=(0, 18), padx=15)
+
         # Labels for the details
         label_texts = ["Graffiti ID", "Source File Name", "Place", "Latitude", "Longitude", "Confidence Level"]
         self.detail_labels = []
@@ -278,6 +292,8 @@ class ReportFrame(customtkinter.CTkFrame):
         """
         image_folder_path = os.path.join(self.project_directory, "results", "graffiti_instances")  # corrected path
         image_path = os.path.join(image_folder_path, graffiti_name + ".jpg")
+        if not os.path.exists(image_path):  # Not drawn yet since the threshold was changed
+            image_path = detection_store.render_result_image(self.project_directory, graffiti_name) or image_path
 
         if os.path.exists(image_path):
             try:
@@ -387,6 +403,24 @@ class ReportFrame(customtkinter.CTkFrame):
         self.map_widget.set_position(latitude, longitude)
         self.map_widget.set_zoom(19)
     
+    def on_threshold_change(self, value):
+        """
+        Rebuilds results.csv for the chosen score threshold from the stored detections and
+        reloads the map and the details.
+
+        Args:
+            value (str): The chosen threshold.
+        """
+        try:
+            detection_store.rebuild_results(self.project_directory, float(value))
+        except (OSError, ValueError) as e:
+            tkinter.messagebox.showerror("Error", f"Error changing the threshold: {e}")
+            return
+
+        self.map_widget.delete_all_marker()
+        self.load_data()
+        self.update_details_frame(-1)  # Clear the details of the old selection
+
     def on_info_button_click(self):
         """
         Opens a new window with a scrollable text area displaying details
@@ -0,0 +1,46 @@
+# One resolution setting for the whole pipeline: preprocessing projects cube faces of
+# this width (and height), and the detector runs on them at this size. Faces are never
+# produced at more pixels than the model looks at, only to be resized away again.
+# Without a setting the pipeline runs as it always has: DEFAULT_RESOLUTION faces, which
+# the detector resizes to its own test size.
+
+# The face width used without a resolution setting
+DEFAULT_RESOLUTION = 2048
+
+# The size the model has always seen (detectron2's default INPUT.MIN_SIZE_TEST): faces of
+# this width give the same detections as the default ones for a sixth of the pixels
+MODEL_RESOLUTION = 800
+
+# The settings compared by resolution_report.py
+RESOLUTIONS = (640, MODEL_RESOLUTION, 1024, 1344, 2048)
+
+# detectron2's default cap on the longer image side at test time
+MAX_SIZE_TEST = 1333
+
+
+def face_width(resolution=None):
+    """Returns the face width for a resolution setting (None means the default)."""
+    resolution = resolution or DEFAULT_RESOLUTION
+    if resolution <= 0:
+        raise ValueError(f"Invalid resolution: {resolution}")
+    return int(resolution)
+
+
+def apply_to_cfg(cfg, resolution=None):
+    """
+    Sets the detector's test-time resize to the resolution, so faces of that width go
+    through the model at their own size. Without a resolution the config is left as is.
+
+    Args:
+        cfg (CfgNode): The detectron2 config, modified in place.
+        resolution (int, optional): The resolution setting.
+
+    Returns:
+        CfgNode: The config.
+    """
+    if resolution is None:
+        return cfg
+    size = face_width(resolution)
+    cfg.INPUT.MIN_SIZE_TEST = size
+    cfg.INPUT.MAX_SIZE_TEST = max(size, MAX_SIZE_TEST)
+    return cfg
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+import numpy as np
+import cv2
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+import cubemap_sampler
+import detect_images
+import face_store
+import image_loader
+import resolution_policy
+from benchmark_preprocessing import synthetic_panorama, write_geotagged_jpeg, BASE_LATITUDE, BASE_LONGITUDE
+from check_cpu_parity import DEFAULT_DATASET
+
+# Score threshold for the AP computation (COCO AP needs the low-confidence detections too)
+EVAL_SCORE_THRESH = 0.05
+
+
+def load_test_split(dataset_directory, limit=None):
+    """
+    Loads the images and boxes of a COCO-annotated split (annotations/test.json, images/).
+    All annotations count as the single graffiti class, like dataset_setup does.
+
+    Returns:
+        list: (image_id, path, [[x, y, w, h], ...]) for every image that exists on disk.
+    """
+    with open(os.path.join(dataset_directory, "annotations", "test.json")) as f:
+        coco_data = json.load(f)
+    boxes = {}
+    for ann in coco_data.get("annotations", []):
+        boxes.setdefault(ann["image_id"], []).append(ann["bbox"])
+    split = []
+    for image_info in coco_data.get("images", []):
+        path = os.path.join(dataset_directory, "images", image_info["file_name"])
+        if os.path.exists(path):
+            split.append((image_info["id"], path, boxes.get(image_info["id"], [])))
+        else:
+            print(f"Warning: Image file not found: {path}")
+    return split[:limit] if limit else split
+
+
+def coco_ap(ground_truth, detections):
+    """
+    Computes COCO bbox AP and AP50 (in points) with pycocotools.
+
+    Args:
+        ground_truth (dict): image_id -> (width, height, [[x, y, w, h], ...]).
+        detections (list): COCO result dicts (image_id, bbox, score, category_id).
+    """
+    gt = COCO()
+    gt.dataset = {
+        "images": [{"id": image_id, "width": w, "height": h} for image_id, (w, h, _) in ground_truth.items()],
+        "annotations": [
+            {"id": i, "image_id": image_id, "bbox": box, "area": box[2] * box[3], "iscrowd": 0, "category_id": 1}
+            for i, (image_id, box) in enumerate(
+                ((image_id, box) for image_id, (_, _, boxes) in ground_truth.items() for box in boxes), 1
+            )
+        ],
+        "categories": [{"id": 1, "name": "graffiti"}],
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        gt.createIndex()
+        if not detections:
+            return {"AP": 0.0, "AP50": 0.0}
+        evaluation = COCOeval(gt, gt.loadRes(detections), "bbox")
+        evaluation.evaluate()
+        evaluation.accumulate()
+        evaluation.summarize()
+    return {"AP": 100 * float(evaluation.stats[0]), "AP50": 100 * float(evaluation.stats[1])}
+
+
+def evaluate_resolution(model_path, split, resolution, backend, batch_size):
+    """
+    Runs the test faces through the detector at one resolution setting.
+
+    The 2048 px test faces are first downscaled to the setting's face width (what
+    preprocessing would have produced), and the boxes with them.
+
+    Returns:
+        dict: AP, AP50 and detection faces/sec.
+    """
+    face_w = resolution_policy.face_width(resolution)
+    cfg = detect_images.setup_cfg(model_path, resolution)
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = EVAL_SCORE_THRESH
+    predictor = detect_images.build_predictor(cfg, backend)
+
+    ground_truth = {}
+    detections = []
+    seconds = 0.0
+    for batch in detect_images.batched(split, batch_size):
+        faces = []
+        for image_id, path, boxes in batch:
+            image = cv2.imread(path)
+            scale = face_w / image.shape[1]
+            if image.shape[:2] != (face_w, face_w):
+                image = cv2.resize(image, (face_w, face_w), interpolation=cv2.INTER_AREA)
+            faces.append(image)
+            ground_truth[image_id] = (face_w, face_w, [[v * scale for v in box] for box in boxes])
+
+        start = time.perf_counter()
+        outputs = predictor(faces)
+        seconds += time.perf_counter() - start
+
+        for (image_id, _, _), output in zip(batch, outputs):
+            instances = output["instances"].to("cpu")
+            for (x0, y0, x1, y1), score in zip(instances.pred_boxes.tensor.tolist(), instances.scores.tolist()):
+                detections.append({"image_id": image_id, "bbox": [x0, y0, x1 - x0, y1 - y0], "score": score, "category_id": 1})
+
+    return dict(coco_ap(ground_truth, detections), detect_faces_per_sec=len(split) / seconds)
+
+
+def measure_preprocessing(panorama_path, resolution, repeats=3):
+    """
+    Times decoding, projecting and PNG-encoding both side faces of one panorama at a
+    resolution setting.
+
+    Returns:
+        dict: Milliseconds per face and bytes per face.
+    """
+    face_w = resolution_policy.face_width(resolution)
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            band, full_height, top = image_loader.load_equirectangular_band(panorama_path, face_w, cubemap_sampler.SIDE_FACES)
+            faces = cubemap_sampler.extract_faces(band, face_w, cubemap_sampler.SIDE_FACES, full_height, top)
+            paths = []
+            for name, face in faces.items():
+                paths.append(os.path.join(directory, face_store.face_file_name(name, "png")))
+                face_store.save_face(face, paths[-1], "png", face_store.DEFAULT_LEVELS["png"])
+            times.append(time.perf_counter() - start)
+        bytes_per_face = sum(os.path.getsize(path) for path in paths) / len(paths)
+    return {
+        "preprocess_ms_per_face": 1000 * float(np.median(times)) / len(cubemap_sampler.SIDE_FACES),
+        "bytes_per_face": int(bytes_per_face),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the accuracy and throughput of the resolution settings.")
+    parser.add_argument("--model", required=True, help="Path to the model weights")
+    parser.add_argument("--resolutions", nargs="+", type=int, default=list(resolution_policy.RESOLUTIONS),
+                        help="Resolution settings to compare")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="Split directory with annotations/test.json and images/")
+    parser.add_argument("--panorama", help="Equirectangular JPEG to time preprocessing on (default: synthetic 8192x4096)")
+    parser.add_argument("--backend", default="eager", choices=["eager", "cpu-optimized"], help="Inference backend")
+    parser.add_argument("--batch-size", type=int, default=detect_images.DEFAULT_BATCH_SIZE, help="Faces per forward pass")
+    parser.add_argument("--limit", type=int, help="Only use the first N test images")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    split = load_test_split(args.dataset, args.limit)
+    if not split:
+        raise SystemExit(f"No test images found in {args.dataset}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        panorama_path = args.panorama
+        if not panorama_path:
+            panorama_path = os.path.join(directory, "panorama.jpg")
+            write_geotagged_jpeg(synthetic_panorama(8192, 4096), panorama_path, BASE_LATITUDE, BASE_LONGITUDE)
+
+        report = []
+        for resolution in args.resolutions:
+            print(f"Evaluating resolution {resolution}...")
+            result = {"resolution": resolution}
+            result.update(evaluate_resolution(args.model, split, resolution, args.backend, args.batch_size))
+            result.update(measure_preprocessing(panorama_path, resolution))
+            report.append(result)
+
+    print(f"\n{'resolution':>10}{'AP':>8}{'AP50':>8}{'detect/s':>10}{'prep ms':>10}{'KiB/face':>10}")
+    for result in report:
+        print(f"{result['resolution']:>10}{result['AP']:>8.1f}{result['AP50']:>8.1f}{result['detect_faces_per_sec']:>10.2f}"
+              f"{result['preprocess_ms_per_face']:>10.0f}{result['bytes_per_face'] / 1024:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"backend": args.backend, "images": len(split), "results": report}, f, indent=2)
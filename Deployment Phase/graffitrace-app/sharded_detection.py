@@ -0,0 +1,198 @@
+import os
+import csv
+import time
+import shutil
+import torch
+import torch.multiprocessing
+from detectron2.modeling import build_model
+from detectron2.data import MetadataCatalog
+import detect_images
+import detection_cache
+import detection_store
+import face_store
+import quantization
+from data_preprocessing import timed
+
+# Per-process state of the detection workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(cfg, model, num_threads, staging_dir, renderer, render_scale, threshold, cached=None):
+    """
+    Wraps the shared model in a predictor and limits this worker's intra-op threads.
+    cached holds the detection cache entries of earlier runs (see detection_cache.py).
+    """
+    torch.set_num_threads(num_threads)
+    _worker["predictor"] = detect_images.BatchPredictor(cfg, model=model)
+    _worker["threshold"] = threshold
+    _worker["cached"] = cached
+    _worker["metadata"] = MetadataCatalog.get("graffiti_train")
+    _worker["staging_dir"] = staging_dir
+    _worker["renderer"] = (renderer, render_scale)
+
+
+def _detect_shard(rows):
+    """
+    Runs one batch of manifest rows through the model in a worker. Faces with graffiti
+    are drawn to the staging directory under their row index, since their graffiti IDs
+    are only known once the earlier rows are done.
+
+    Args:
+        rows (list): (row_index, (image_name, latitude, longitude, face_path_or_array)) pairs.
+
+    Returns:
+        list: (row_index, image_name, latitude, longitude, num_graffiti_instances, entry,
+              digest, hit, timings) per readable face, in row order. entry holds all of the
+              face's detections (see detection_cache.entry_from_instances); digest is None
+              unless the detection cache is used, and hit tells whether entry came from it.
+              timings holds the seconds the face spent in each of detect_images.DETECTION_STAGES.
+    """
+    predictor = _worker["predictor"]
+    cached = _worker["cached"]
+    renderer, render_scale = _worker["renderer"]
+    prepared = []
+    for row_index, (image_name, latitude, longitude, image) in rows:
+        timings = {"face": image_name}
+        with timed(timings, "decode"):
+            if isinstance(image, str):
+                image = face_store.load_face(image)
+        if image is None:
+            print(f"Warning: Could not read image: {image_name}")
+            continue
+        digest = entry = None
+        if cached is not None:
+            with timed(timings, "cache"):
+                digest = detection_cache.face_digest(image)
+                entry = cached.get(digest)
+        timings["cached"] = entry is not None
+        face = (row_index, image_name, latitude, longitude, image, digest, entry is not None, timings)
+        if entry is None:
+            with timed(timings, "preprocess"):
+                inputs = predictor.preprocess(image)
+            prepared.append((face, digest, inputs, None))
+        else:
+            prepared.append((face, digest, None, detection_cache.instances_from_entry(entry, image.shape[:2])))
+    if not prepared:
+        return []
+
+    results = []
+    for face, instances, forward_seconds in detect_images.predict_in_order(prepared, predictor, len(prepared)):
+        row_index, image_name, latitude, longitude, image, digest, hit, timings = face
+        timings["forward"] = forward_seconds
+        with timed(timings, "filter"):
+            filtered_instances = detect_images.filter_instances(instances, _worker["threshold"])
+            entry = detection_cache.entry_from_instances(instances)
+        timings["detections"] = len(filtered_instances)
+        if len(filtered_instances) > 0:
+            detect_images.render_detections(
+                image, filtered_instances, _worker["metadata"],
+                os.path.join(_worker["staging_dir"], f"{row_index:07d}.jpg"), renderer, render_scale, timings
+            )
+        results.append((row_index, image_name, latitude, longitude, len(filtered_instances), entry, digest, hit, timings))
+    return results
+
+
+def detect_faces_sharded(faces, output_dir, instance_dir, model_path, target_place, processes,
+                         batch_size=detect_images.DEFAULT_BATCH_SIZE, renderer="visualizer", render_scale=None,
+                         resolution=None, cache_dir=None, threshold=detect_images.DETECTION_THRESHOLD):
+    """
+    Like detect_images.detect_faces, but spreads the faces over several worker processes
+    that share one copy of the model weights.
+
+    The weights are loaded once here and moved to shared memory; the workers receive
+    handles to them instead of copies. Batches of rows are handed out in order, each
+    worker gets an equal share of the CPU threads, and the results are merged back in
+    row order, so results.csv and the "Graffiti NNNNN" IDs come out exactly as with the
+    single-process path.
+
+    Args:
+        faces (iterable): (image_name, latitude, longitude, face) tuples, see detect_faces.
+        output_dir (str): The results directory (results.csv is written here).
+        instance_dir (str): Where the result images go.
+        model_path (str): The float model weights (.pth).
+        target_place (str): The name of the place, written to results.csv.
+        processes (int): The number of worker processes.
+        batch_size (int): The number of faces per forward pass (and per task).
+        renderer (str): How result images are drawn, see detect_images.RENDERERS.
+        render_scale (float, optional): The scale of the result images.
+        resolution (int, optional): The detector input size, see resolution_policy.py.
+        cache_dir (str, optional): Where the detection cache is kept, see detect_faces.
+        threshold (float): The score a detection needs to count in results.csv; all
+                           detections are kept in detections.npz, see detect_faces.
+
+    Returns:
+        dict: The timing summary, see detect_images.summarize_timings. As with detect_faces,
+              the per-face timings go to results/timings.jsonl and the summary to
+              results/timings_summary.json; the stages are timed in the workers, and
+              "decode_wait" is the time the merge loop waited for the workers' results.
+    """
+    if renderer not in detect_images.RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    if quantization.read_quantization_info(model_path) is not None:
+        raise ValueError("Sharded detection shares float weights; use a float model")
+
+    run_timings = {}
+    with timed(run_timings, "model_load"):
+        cfg = detect_images.setup_cfg(model_path, resolution)
+        cfg.MODEL.DEVICE = "cpu"
+        model = build_model(cfg)
+        quantization.load_weights(model, model_path)
+        model.eval()
+        model.share_memory()
+    with timed(run_timings, "cache_load"):
+        cache = detection_cache.DetectionCache(cache_dir, cfg) if cache_dir else None
+
+    staging_dir = os.path.join(output_dir, "staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    num_threads = max(1, (os.cpu_count() or 1) // processes)
+    context = torch.multiprocessing.get_context("spawn")
+
+    with open(os.path.join(output_dir, 'results.csv'), mode='w', newline='') as f, context.Pool(
+        processes, initializer=_init_worker,
+        initargs=(cfg, model, num_threads, staging_dir, renderer, render_scale, threshold,
+                  cache.previous if cache else None)
+    ) as pool:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow([
+            "graffiti_id", "source_file_name", "place", "latitude", "longitude", "num_graffiti_instances"
+        ])
+
+        graffiti_id = 1
+        records = []
+        table = detection_store.DetectionTable()
+        start_time = time.perf_counter()
+        shards = pool.imap(_detect_shard, detect_images.batched(enumerate(faces), batch_size))
+        for results in detect_images.waited(shards, run_timings, "decode_wait"):
+            for row_index, image_name, latitude, longitude, num_graffiti_instances, entry, digest, hit, timings in results:
+                records.append(timings)
+                table.add(image_name, latitude, longitude, entry["boxes"], entry["scores"], entry["classes"])
+                if digest is not None:
+                    cache.add(digest, entry, hit)
+                if num_graffiti_instances == 0:
+                    print(f"\nNo graffiti detected in {image_name}")
+                    continue
+                result_id = f"Graffiti {graffiti_id:05}"
+                result_image_path = os.path.join(instance_dir, f"{result_id}.jpg")
+                os.replace(os.path.join(staging_dir, f"{row_index:07d}.jpg"), result_image_path)
+                print(f"\nResult saved to {result_image_path}")
+                detect_images.record_detections(
+                    image_name, num_graffiti_instances, csv_writer, result_id, latitude, longitude, target_place
+                )
+                graffiti_id += 1
+        seconds = time.perf_counter() - start_time
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    table.save(
+        output_dir, target_place, renderer,
+        detect_images.RENDERERS[renderer] if render_scale is None else render_scale
+    )
+    detection_store.write_threshold(output_dir, threshold)
+    if cache is not None:
+        cache.save()
+        print(f"Reused cached detections for {cache.hits} faces.")
+
+    summary = detect_images.summarize_timings(records, run_timings, seconds)
+    summary["processes"] = processes
+    detect_images.write_timings(output_dir, records, summary)
+    detect_images.print_timing_summary(summary)
+    return summary
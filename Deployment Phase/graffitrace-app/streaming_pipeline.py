@@ -0,0 +1,122 @@
+import os
+import time
+import queue
+import threading
+import data_preprocessing
+import detect_images
+
+
+class FaceQueue(queue.Queue):
+    """
+    Bounded queue between preprocessing and detection. Once the consumer closes it,
+    blocked and future puts raise instead of waiting forever, which stops preprocessing.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.closed = threading.Event()
+
+    def put(self, item, block=True, timeout=None):
+        """Like queue.Queue.put (raising queue.Full when not blocking or on timeout), but checks for closing."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.closed.is_set():
+                raise RuntimeError("Face queue closed: detection has stopped")
+            if not block:
+                return super().put(item, block=False)
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                raise queue.Full
+            try:
+                return super().put(item, timeout=wait)
+            except queue.Full:
+                continue
+
+    def iter_faces(self):
+        """Yields queued faces until the producer signals the end with None."""
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+
+def run_streaming_pipeline(project_directory, model_path, target_place, keep_faces=False, queue_size=8,
+                           workers=None, face_format="png", encode_level=None,
+                           batch_size=detect_images.DEFAULT_BATCH_SIZE, renderer="visualizer", render_scale=None,
+                           backend="eager", num_threads=None, resolution=None, use_cache=True,
+                           threshold=detect_images.DETECTION_THRESHOLD, screen_threshold=None,
+                           gate_path=None, gate_threshold=None, skip_duplicates=False):
+    """
+    Runs preprocessing and detection together: faces go from the preprocessing workers
+    through a bounded in-memory queue straight into the detector, instead of being
+    written to 'Preprocessed' and read back.
+
+    Args:
+        project_directory (str): The path to the project directory.
+        model_path (str): The path to the model file.
+        target_place (str): The name of the place, written to results.csv.
+        keep_faces (bool): Also write the new faces, the manifest and the index to
+                           'Preprocessed', like run_data_preprocessing does.
+        queue_size (int): The maximum number of faces waiting for the detector.
+        workers (int, optional): The number of preprocessing processes.
+        face_format (str): The format of the kept faces.
+        encode_level (int, optional): The encoder setting for that format.
+        batch_size (int): The number of faces sent through the model at once.
+        renderer (str): How result images are drawn, see detect_images.RENDERERS.
+        render_scale (float, optional): The scale of the result images.
+        backend (str): The inference backend, see detect_images.build_predictor.
+        num_threads (int, optional): The intra-op thread count for the "cpu-optimized" backend.
+        resolution (int, optional): The face width and detector input size, see resolution_policy.py.
+        use_cache (bool): Reuse the detections of faces already run with the same model and
+                          settings, see detection_cache.py.
+        threshold (float): The score a detection needs to count in results.csv.
+        screen_threshold (float, optional): Screen the faces at low resolution first, see cascade.py.
+        gate_path (str, optional): A gate classifier whose rejected faces skip the detector,
+                                   see gate_classifier.py.
+        gate_threshold (float, optional): The gate's threshold, instead of the calibrated one.
+        skip_duplicates (bool): Reuse the detections of near-identical consecutive faces,
+                                see near_duplicates.py.
+
+    Returns:
+        dict: The timing summary of detection, see detect_images.detect_faces.
+    """
+    os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+    data_preprocessing.prepare_directory(project_directory)
+    output_dir, instance_dir = detect_images.prepare_results_directory(project_directory)
+
+    face_queue = FaceQueue(queue_size)
+    errors = []
+
+    def produce():
+        try:
+            data_preprocessing.process_images(
+                project_directory, workers=workers, face_format=face_format, encode_level=encode_level,
+                face_queue=face_queue, keep_faces=keep_faces, resolution=resolution
+            )
+        except Exception as e:
+            if not face_queue.closed.is_set():
+                errors.append(e)
+        finally:
+            try:
+                face_queue.put(None)
+            except RuntimeError:
+                pass  # Detection has stopped and no longer reads the queue
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        summary = detect_images.detect_faces(
+            face_queue.iter_faces(), output_dir, instance_dir, model_path, target_place, batch_size=batch_size,
+            renderer=renderer, render_scale=render_scale, backend=backend, num_threads=num_threads,
+            resolution=resolution, cache_dir=project_directory if use_cache else None, threshold=threshold,
+            screen_threshold=screen_threshold, gate_path=gate_path, gate_threshold=gate_threshold,
+            skip_duplicates=skip_duplicates
+        )
+    finally:
+        face_queue.closed.set()
+        producer.join()
+
+    if errors:
+        raise errors[0]
+    return summary
@@ -5,7 +5,7 @@ from detectron2.data import DatasetCatalog, MetadataCatalog
 from detectron2.structures import BoxMode
 
 def get_graffiti_dicts(split):
-    """Loads COCO-formatted dataset for the given split (train/validation)."""
+    """Loads COCO-formatted dataset for the given split (train/validation/test)."""
     dataset_dir = os.path.join("datasets", split)
     img_dir = os.path.join(dataset_dir, "images")
     ann_path = os.path.join(dataset_dir, "annotations", f"{split}.json")
@@ -50,8 +50,8 @@ def get_graffiti_dicts(split):
     return dataset_dicts
 
 def register_datasets():
-    """Registers training and validation datasets in Detectron2."""
-    for split in ["train", "validation"]:
+    """Registers training, validation, and test datasets in Detectron2."""
+    for split in ["train", "validation", "test"]:
         dataset_name = f"graffiti_{split}"
         if dataset_name not in DatasetCatalog.list():  # Prevent duplicate registration
             DatasetCatalog.register(dataset_name, lambda split=split: get_graffiti_dicts(split))
@@ -0,0 +1,138 @@
+"""
+Produces an int8 CPU variant of a trained graffiti detector for the deployment app.
+
+The Linear layers of the box head are quantized dynamically (int8 weights, activations
+quantized per batch). The validation split picks the largest set of layers that stays
+within the allowed accuracy drop, and the test split then gates the result. The model is
+only written if it passes. detect_images.setup_cfg loads the output like any other model.
+
+Run from the repository root (the datasets are read from ./datasets), e.g.:
+
+    python detectron2_model/quantize_model.py --model model_final.pth --max-drop 1.0
+"""
+import os
+import sys
+import copy
+import json
+import argparse
+import tempfile
+from detectron2.config import get_cfg
+from detectron2.model_zoo import model_zoo
+from detectron2.modeling import build_model
+from detectron2.checkpoint import DetectionCheckpointer
+from detectron2.data import build_detection_test_loader, DatasetCatalog, DatasetMapper
+from detectron2.evaluation import COCOEvaluator, inference_on_dataset
+from dataset_setup import register_datasets
+
+# The deployment app holds the quantization helpers the app itself loads models with
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Deployment Phase", "graffitrace-app"))
+import quantization
+
+# Layer sets tried on the validation split, most aggressive first
+CANDIDATE_LAYER_SETS = [
+    quantization.BOX_HEAD_LINEAR_LAYERS,
+    quantization.BOX_HEAD_LINEAR_LAYERS[:2],  # Keep the classifier and box regressor in float
+    quantization.BOX_HEAD_LINEAR_LAYERS[:1],
+]
+
+
+def setup_cfg(model_path):
+    """Sets up the Detectron2 configuration for CPU evaluation."""
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file("COCO-Detection/faster_rcnn_R_101_FPN_3x.yaml"))
+    cfg.MODEL.WEIGHTS = model_path
+    cfg.MODEL.ROI_HEADS.NUM_CLASSES = 1  # Only one class: graffiti
+    cfg.MODEL.DEVICE = "cpu"  # The quantized layers only run on the CPU
+    cfg.DATALOADER.FILTER_EMPTY_ANNOTATIONS = False
+    cfg.DATALOADER.NUM_WORKERS = 0
+    return cfg
+
+
+def evaluate(model, cfg, dataset_name, limit=None):
+    """
+    Runs COCO evaluation of a model on a registered split (or its first `limit` images).
+
+    Returns:
+        dict: The "AP" and "AP50" of the bbox task.
+    """
+    if limit:
+        loader = build_detection_test_loader(
+            dataset=DatasetCatalog.get(dataset_name)[:limit], mapper=DatasetMapper(cfg, is_train=False)
+        )
+    else:
+        loader = build_detection_test_loader(cfg, dataset_name)
+    with tempfile.TemporaryDirectory() as output_dir:
+        evaluator = COCOEvaluator(dataset_name, cfg, False, output_dir=output_dir)
+        results = inference_on_dataset(model, loader, evaluator)
+    bbox_results = results.get("bbox", {})
+    return {"AP": bbox_results.get("AP", float('nan')), "AP50": bbox_results.get("AP50", float('nan'))}
+
+
+def accuracy_drop(reference, candidate):
+    """The larger of the AP and AP50 drops, in AP points."""
+    return max(reference["AP"] - candidate["AP"], reference["AP50"] - candidate["AP50"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize a trained graffiti detector to int8 for CPU inference.")
+    parser.add_argument("--model", required=True, help="Trained float model (model_final.pth)")
+    parser.add_argument("--output", help="Where to write the int8 model (default: <model>_int8.pth)")
+    parser.add_argument("--max-drop", type=float, default=1.0,
+                        help="Largest accepted drop of AP or AP50 on the test split, in AP points")
+    parser.add_argument("--calibration-limit", type=int,
+                        help="Only use the first N validation images to pick the layers")
+    parser.add_argument("--test-limit", type=int, help="Only use the first N test images for the gate")
+    args = parser.parse_args()
+
+    register_datasets()
+    output_path = args.output or os.path.splitext(args.model)[0] + "_int8.pth"
+
+    cfg = setup_cfg(args.model)
+    float_model = build_model(cfg)
+    DetectionCheckpointer(float_model).load(args.model)
+    float_model.eval()
+
+    # Calibration: pick the most aggressive layer set that stays within the budget on validation
+    print("Evaluating the float model on the validation split...")
+    float_validation = evaluate(float_model, cfg, "graffiti_validation", args.calibration_limit)
+    chosen_layers = None
+    calibration = []
+    for layer_names in CANDIDATE_LAYER_SETS:
+        print(f"Trying int8 layers: {', '.join(layer_names)}")
+        candidate = quantization.quantize_linear_layers(copy.deepcopy(float_model), layer_names)
+        candidate_validation = evaluate(candidate, cfg, "graffiti_validation", args.calibration_limit)
+        drop = accuracy_drop(float_validation, candidate_validation)
+        calibration.append({"layers": list(layer_names), "validation": candidate_validation, "drop": drop})
+        print(f"  AP {candidate_validation['AP']:.2f}, AP50 {candidate_validation['AP50']:.2f} (drop {drop:.2f})")
+        if drop <= args.max_drop:
+            chosen_layers = layer_names
+            break
+
+    if chosen_layers is None:
+        sys.exit(f"Refusing to write a quantized model: every layer set drops more than {args.max_drop} AP on validation")
+
+    # Gate: compare against the float model on the test annotations
+    print("Evaluating the float and int8 models on the test split...")
+    quantized_model = quantization.quantize_linear_layers(copy.deepcopy(float_model), chosen_layers)
+    float_test = evaluate(float_model, cfg, "graffiti_test", args.test_limit)
+    quantized_test = evaluate(quantized_model, cfg, "graffiti_test", args.test_limit)
+    drop = accuracy_drop(float_test, quantized_test)
+
+    report = {
+        "float_model": args.model,
+        "layers": list(chosen_layers),
+        "float_validation": float_validation,
+        "calibration": calibration,
+        "float_test": float_test,
+        "quantized_test": quantized_test,
+        "AP_delta": quantized_test["AP"] - float_test["AP"],
+        "AP50_delta": quantized_test["AP50"] - float_test["AP50"],
+        "max_drop": args.max_drop,
+    }
+    print(json.dumps(report, indent=4))
+
+    if drop > args.max_drop:
+        sys.exit(f"Refusing to write a quantized model: accuracy drops {drop:.2f} AP on test (limit {args.max_drop})")
+
+    quantization.save_quantized_model(quantized_model, output_path, chosen_layers, report)
+    print(f"Quantized model saved to {output_path}")
@@ -0,0 +1,215 @@
+"""
+Trains the graffiti/no-graffiti gate the deployment app can run before the detector
+(see gate_classifier.py in the app), and calibrates its threshold.
+
+The labels come from the detector's COCO annotations: an image with at least one
+graffiti box is positive, an image without any is negative. The epoch with the lowest
+validation loss is kept. The threshold is then calibrated on the validation split as the
+highest one that still lets through the required share of graffiti images (gate
+recall), and the test split reports what that threshold costs in recall and saves in
+detector runs (skipped compute). The gate file records the threshold and the report.
+
+Run from the repository root (the datasets are read from ./datasets), e.g.:
+
+    python detectron2_model/train_gate.py --output gate.pth --min-recall 0.99
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import torch
+from torch import nn
+from dataset_setup import get_graffiti_dicts
+
+# The deployment app holds the gate model the app itself loads gates with
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Deployment Phase", "graffitrace-app"))
+import gate_classifier
+
+# Thresholds compared in the calibration report
+THRESHOLDS = (0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5)
+
+
+def load_split(split, input_size, limit=None):
+    """
+    Reads a split as gate inputs and image-level labels.
+
+    Returns:
+        tuple: The (N, 3, input_size, input_size) inputs, the 0/1 labels and the number
+               of annotated boxes of every image.
+    """
+    records = get_graffiti_dicts(split)[:limit]
+    inputs = []
+    boxes = []
+    for record in records:
+        image = cv2.imread(record["file_name"])
+        if image is None:
+            print(f"Warning: Could not read image: {record['file_name']}")
+            continue
+        inputs.append(gate_classifier.to_tensor(image, input_size))
+        boxes.append(len(record["annotations"]))
+    boxes = torch.tensor(boxes)
+    return torch.stack(inputs), (boxes > 0).float(), boxes
+
+
+def augment(batch):
+    """Random horizontal flips and brightness changes, per image."""
+    flip = torch.rand(len(batch)) < 0.5
+    batch = torch.where(flip[:, None, None, None], batch.flip(3), batch)
+    brightness = 1.0 + (torch.rand(len(batch), 1, 1, 1) - 0.5) * 0.4
+    return (batch * brightness).clamp(0.0, 1.0)
+
+
+def predict(model, inputs, batch_size=64):
+    """Returns the graffiti probability of every input."""
+    model.eval()
+    with torch.no_grad():
+        return torch.cat([torch.sigmoid(model(inputs[i:i + batch_size])) for i in range(0, len(inputs), batch_size)])
+
+
+def train(train_inputs, train_labels, validation_inputs, validation_labels, epochs, batch_size, lr, device):
+    """
+    Trains a GateNet, weighting the positives by the class ratio of the training split.
+
+    Returns:
+        GateNet: The model of the epoch with the lowest validation loss, on the CPU.
+    """
+    model = gate_classifier.GateNet().to(device)
+    positives = float(train_labels.sum())
+    pos_weight = torch.tensor((len(train_labels) - positives) / max(positives, 1.0), device=device)
+    criterion = nn.BCEWithLogitsLoss(pos_weight=pos_weight)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, epochs)
+
+    best_loss = float("inf")
+    best_state = None
+    for epoch in range(epochs):
+        model.train()
+        order = torch.randperm(len(train_inputs))
+        train_loss = 0.0
+        for i in range(0, len(order), batch_size):
+            index = order[i:i + batch_size]
+            logits = model(augment(train_inputs[index]).to(device))
+            loss = criterion(logits, train_labels[index].to(device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(index)
+        scheduler.step()
+
+        validation_loss = 0.0
+        model.eval()
+        with torch.no_grad():
+            for i in range(0, len(validation_inputs), batch_size):
+                logits = model(validation_inputs[i:i + batch_size].to(device))
+                loss = criterion(logits, validation_labels[i:i + batch_size].to(device))
+                validation_loss += loss.item() * len(logits)
+        validation_loss /= len(validation_inputs)
+        print(f"Epoch {epoch + 1}/{epochs}: train loss {train_loss / len(order):.4f}, validation loss {validation_loss:.4f}")
+        if validation_loss < best_loss:
+            best_loss = validation_loss
+            best_state = {key: value.detach().cpu().clone() for key, value in model.state_dict().items()}
+
+    model = gate_classifier.GateNet()
+    model.load_state_dict(best_state)
+    return model.eval()
+
+
+def calibration_table(probabilities, labels, boxes, thresholds=THRESHOLDS):
+    """
+    Scores every threshold on one split.
+
+    Returns:
+        list: Per threshold, the gate recall (share of graffiti images let through), the
+              share of graffiti boxes on images let through, and the skipped compute
+              (share of all images that would skip the detector).
+    """
+    table = []
+    for threshold in thresholds:
+        passed = probabilities >= threshold
+        table.append({
+            "threshold": threshold,
+            "gate_recall": float(passed[labels > 0].float().mean()) if labels.sum() else 1.0,
+            "box_recall": float(boxes[passed].sum() / boxes.sum()) if boxes.sum() else 1.0,
+            "skipped": float((~passed).float().mean()),
+            "graffiti_images_skipped": int((~passed & (labels > 0)).sum()),
+        })
+    return table
+
+
+def pick_threshold(table, min_recall):
+    """The highest threshold whose gate recall is at least min_recall, or None."""
+    candidates = [row for row in table if row["gate_recall"] >= min_recall]
+    return max(candidates, key=lambda row: row["threshold"], default=None)
+
+
+def print_table(split, table):
+    print(f"\n{split}:")
+    print(f"{'thresh':>8}{'recall':>8}{'boxes':>8}{'skipped':>9}{'missed':>8}")
+    for row in table:
+        print(f"{row['threshold']:>8.2f}{row['gate_recall']:>8.3f}{row['box_recall']:>8.3f}"
+              f"{row['skipped']:>9.0%}{row['graffiti_images_skipped']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and calibrate the graffiti/no-graffiti gate.")
+    parser.add_argument("--output", default="gate.pth", help="Where to write the gate")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--input-size", type=int, default=gate_classifier.GATE_INPUT_SIZE)
+    parser.add_argument("--min-recall", type=float, default=0.99,
+                        help="Share of graffiti images the gate must let through on validation")
+    parser.add_argument("--limit", type=int, help="Only use the first N images of each split")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the calibration report to this JSON file")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    print("Loading the splits...")
+    train_inputs, train_labels, _ = load_split("train", args.input_size, args.limit)
+    validation_inputs, validation_labels, validation_boxes = load_split("validation", args.input_size, args.limit)
+    test_inputs, test_labels, test_boxes = load_split("test", args.input_size, args.limit)
+    print(f"{len(train_labels)} training images, {int(train_labels.sum())} with graffiti")
+
+    model = train(train_inputs, train_labels, validation_inputs, validation_labels,
+                  args.epochs, args.batch_size, args.lr, device)
+
+    # Calibration: the highest threshold that keeps the required recall on validation
+    validation_table = calibration_table(predict(model, validation_inputs), validation_labels, validation_boxes)
+    print_table("Validation", validation_table)
+    chosen = pick_threshold(validation_table, args.min_recall)
+    if chosen is None:
+        sys.exit(f"No threshold lets through {args.min_recall:.0%} of the graffiti images on validation; "
+                 f"not writing a gate")
+    threshold = chosen["threshold"]
+
+    # Report: what that threshold costs and saves on the test split, and what the gate costs per face
+    test_table = calibration_table(predict(model, test_inputs), test_labels, test_boxes)
+    print_table("Test", test_table)
+    start = time.perf_counter()
+    for i in range(len(test_inputs)):
+        predict(model, test_inputs[i:i + 1])
+    gate_ms = (time.perf_counter() - start) / len(test_inputs) * 1000
+
+    report = {
+        "min_recall": args.min_recall,
+        "threshold": threshold,
+        "validation": validation_table,
+        "test": test_table,
+        "test_at_threshold": next(row for row in test_table if row["threshold"] == threshold),
+        "gate_ms_per_face_cpu": gate_ms,
+    }
+    at_threshold = report["test_at_threshold"]
+    print(f"\nThreshold {threshold}: test gate recall {at_threshold['gate_recall']:.3f}, "
+          f"box recall {at_threshold['box_recall']:.3f}, {at_threshold['skipped']:.0%} of faces skip the detector "
+          f"(gate {gate_ms:.1f} ms per face on the CPU)")
+
+    gate_classifier.save_gate(model, args.output, args.input_size, threshold, report)
+    print(f"Gate saved to {args.output}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)